@@ -0,0 +1,65 @@
+from multiprocessing import Pool
+import sys
+
+from Parser import Node
+from Interpreter import Interpreter
+
+# Runs one Program over many input records on a pool of worker processes. The
+# Program is pickled once per worker, every worker keeps one interpreter and
+# runs each record in a fresh scope on it. Results come back in record order
+# while later records are still running. Builtins are the ones the workers
+# have, hosts register their own before creating the pool. Results only hold
+# plain data, what the scripts log goes to stderr.
+
+worker = None
+
+class Worker:
+    def __init__(self, program, outputs: list = None):
+        self.program = program
+        self.outputs = outputs
+        self.interpreter = Interpreter()
+
+    def run(self, record: dict):
+        env = self.interpreter.run(self.program, record)
+
+        if self.outputs != None:
+            return {name: data(env.get(name)) for name in self.outputs}
+
+        # Functions don't leave the worker, every other top level value the
+        # program set does
+        return {name: data(value) for name, value in env.symbolTable.items()
+                if not (name in env.globals or isinstance(value, Node) or (name in record and record[name] is value))}
+
+def data(value, path: list = []):
+    # A copy of value holding only what JSON can hold. Functions, anything
+    # else that isn't data and objects containing themselves are dropped
+    # from objects and become null in arrays. path has the ids of the
+    # arrays and objects value is inside of.
+    if value is None or type(value) in (bool, float, int, str):
+        return value
+    if type(value) not in (list, dict) or id(value) in path:
+        return None
+
+    path = path + [id(value)]
+    if type(value) is list:
+        return [data(item, path) for item in value]
+
+    return {key: data(item, path) for key, item in value.items()
+            if not isinstance(item, Node) and (type(item) not in (list, dict) or id(item) not in path)}
+
+def start(program, outputs: list):
+    global worker
+    # The parent reads results, not output, so a script's log can't end up
+    # in the middle of them
+    sys.stdout = sys.stderr
+    worker = Worker(program, outputs)
+
+def evaluate(record: dict):
+    return worker.run(record)
+
+def run(program, records, outputs: list = None, processes: int = None, chunksize: int = 64):
+    # Yields one dict of results per record, outputs names the variables to
+    # return and defaults to everything the program assigns at the top level
+    with Pool(processes, start, (program, outputs)) as pool:
+        for result in pool.imap(evaluate, records, chunksize):
+            yield result
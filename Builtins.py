@@ -0,0 +1,67 @@
+from Parser import GlobalNode, plain
+
+from time import sleep, time
+from random import randint
+import asyncio
+
+# Every builtin is a plain Python function called with the evaluated arguments,
+# both engines call it directly. Hosts add their own with register() before
+# creating an engine, or hand an engine a dict of their own.
+
+BUILTINS = {}
+
+# Builtins that wait without blocking the thread, as async functions. They
+# replace the blocking ones for scripts run with VM.runAsync.
+WAITING = {}
+
+def register(name: str, function, arity: int = None, registry: dict = BUILTINS):
+    registry[name] = GlobalNode(name, function, arity)
+    return function
+
+def builtin(name: str, arity: int = None, registry: dict = BUILTINS):
+    def decorator(function):
+        return register(name, function, arity, registry)
+
+    return decorator
+
+def asynchronous(builtins: dict = BUILTINS):
+    # The builtins for a VM that runs scripts on an event loop
+    return {**builtins, **WAITING}
+
+@builtin('log', 1)
+def log(value):
+    print(plain(value))
+
+@builtin('sleep', 1)
+def wait(seconds):
+    sleep(plain(seconds))
+
+@builtin('time', 0)
+def now():
+    return time()
+
+@builtin('input', 1)
+def prompt(message):
+    print(plain(message), end='')
+    return input('')
+
+@builtin('random', 2)
+def random(low, high):
+    return randint(int(plain(low)), int(plain(high)))
+
+@builtin('tonumber', 1)
+def tonumber(value):
+    return float(plain(value))
+
+@builtin('tostring', 1)
+def tostring(value):
+    return str(plain(value))
+
+@builtin('sleep', 1, WAITING)
+async def waitAsync(seconds):
+    await asyncio.sleep(plain(seconds))
+
+@builtin('input', 1, WAITING)
+async def promptAsync(message):
+    print(plain(message), end='')
+    return await asyncio.get_running_loop().run_in_executor(None, input, '')
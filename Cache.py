@@ -0,0 +1,151 @@
+from enum import Enum
+from hashlib import sha256
+import io
+import os
+import pickle
+import struct
+import threading
+
+from Lexer import Lexer, Token, TokenType, CHUNK_SIZE
+from Parser import Parser, Node, NodeType, GlobalNode
+from Compiler import Code, OpCode
+
+# A .gof file is a fixed header followed by a pickled payload. The header
+# records the source it was built from (mtime, size and a hash of the
+# contents), so a cached file is only trusted while the source is unchanged.
+# Bump VERSION whenever the layout of nodes or bytecode changes.
+
+MAGIC = b'GOF\x00'
+VERSION = 11
+
+HEADER = struct.Struct('<4sHBqq32s')
+
+class Kind(Enum):
+    AST = 0     # Parsed program, for the tree-walk interpreter
+    CODE = 1    # Compiled bytecode, for the VM
+
+CACHE_DIR = '__gofcache__'
+
+# The only types a payload is built from. Unpickling calls whatever a
+# pickle names, so a .gof naming anything else is refused instead of loaded.
+TYPES = {(cls.__module__, cls.__name__): cls for cls in
+         [Node, NodeType, Token, TokenType, Code, OpCode] + Node.__subclasses__() if cls is not GlobalNode}
+
+class Unpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) not in TYPES:
+            raise pickle.UnpicklingError(f'{module}.{name} is not allowed in a .gof file.')
+        return TYPES[(module, name)]
+
+def unpickle(payload: bytes):
+    return Unpickler(io.BytesIO(payload)).load()
+
+def cachePath(path: str, kind: Kind):
+    directory, name = os.path.split(path)
+    return os.path.join(directory, CACHE_DIR, f'{os.path.splitext(name)[0]}.{kind.name.lower()}.gof')
+
+def readGof(path: str, kind: Kind):
+    # Returns (header, payload bytes), or None if the file is missing or was
+    # written by another version
+    try:
+        file = open(path, 'rb')
+        data = file.read()
+        file.close()
+    except OSError:
+        return None
+
+    if len(data) < HEADER.size:
+        return None
+
+    header = HEADER.unpack_from(data)
+    if header[0] != MAGIC or header[1] != VERSION or header[2] != kind.value:
+        return None
+
+    return header, data[HEADER.size:]
+
+def writeGof(path: str, kind: Kind, payload, mtime: int = 0, size: int = 0, digest: bytes = b''):
+    data = HEADER.pack(MAGIC, VERSION, kind.value, mtime, size, digest) + pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+
+    # Written to the side and moved into place so a reader never sees half a file
+    temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    file = open(temp, 'wb')
+    file.write(data)
+    file.close()
+    os.replace(temp, path)
+
+def loadGof(path: str, kind: Kind):
+    # Loads a .gof file that has no source to check against, like the output of main.py -c
+    gof = readGof(path, kind)
+    if gof == None:
+        raise Exception(f'{path} is not a {kind.name} .gof file for this version of EPL.')
+
+    return unpickle(gof[1])
+
+class Source:
+    # A source file for the Lexer to read a chunk at a time, hashed on the
+    # way so its digest doesn't take reading it all up front
+    def __init__(self, file):
+        self.file = file
+        self.hash = sha256()
+
+    def read(self, size: int = -1):
+        chunk = self.file.read(size)
+        self.hash.update(chunk.encode())
+        return chunk
+
+    def digest(self):
+        # Reads whatever the Lexer hasn't, the digest is of the whole file
+        while self.read(CHUNK_SIZE):
+            pass
+        return self.hash.digest()
+
+def parse(source):
+    # source is the text or an open file to lex it from
+    return Parser(Lexer(source).stream()).parse()
+
+def load(path: str, kind: Kind = Kind.AST, build = parse):
+    # Returns the cached payload for the source file at path, building it with
+    # build(source) from the open file and writing the cache when there is no
+    # fresh one
+    cache = cachePath(path, kind)
+    stat = os.stat(path)
+    gof = readGof(cache, kind)
+
+    if gof != None:
+        header, payload = gof
+        if header[3] == stat.st_mtime_ns and header[4] == stat.st_size:
+            try:
+                return unpickle(payload)
+            except Exception:
+                gof = None
+
+    # Touched but unchanged sources keep their payload, only the header is renewed
+    result = None
+    if gof != None:
+        file = open(path, 'r')
+        digest = Source(file).digest()
+        file.close()
+
+        if digest == gof[0][5]:
+            try:
+                result = unpickle(gof[1])
+            except Exception:
+                pass
+
+    if result == None:
+        file = open(path, 'r')
+        try:
+            source = Source(file)
+            result = build(source)
+            digest = source.digest()
+        finally:
+            file.close()
+
+    # Pickle before anything else sees the result, the resolver annotates nodes in place
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        writeGof(cache, kind, result, stat.st_mtime_ns, stat.st_size, digest)
+    except OSError:
+        pass
+
+    return result
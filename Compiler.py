@@ -0,0 +1,316 @@
+from enum import Enum
+from bisect import bisect_right
+
+from Parser import *
+from Resolver import Resolver
+
+from Error import *
+
+class OpCode(Enum):
+    LOAD_CONST = 0
+    LOAD_LOCAL = 1
+    STORE_LOCAL = 2
+    LOAD_DEREF = 3
+    STORE_DEREF = 4
+    LOAD_GLOBAL = 5
+    STORE_GLOBAL = 6
+    POP = 7
+
+    BINARY = 8
+    COMPARE = 9
+    NEGATE = 10
+    LENGTH = 11
+
+    BUILD_ARRAY = 12
+    BUILD_OBJECT = 13
+    INDEX = 14
+    STORE_INDEX = 15
+
+    JUMP = 16
+    JUMP_IF_FALSE = 17
+
+    MAKE_FUNCTION = 18
+    CALL = 19
+    RETURN = 20
+
+    CLEAR = 21
+    ITER_RANGE = 22
+    ITER_DS = 23
+    FOR_ITER = 24
+
+    IMPORT = 25
+
+    FORMAT = 27
+    INDEX_PATH = 28
+
+class Code:
+    # A compiled function body, or the top level of a file. Instructions are
+    # (opcode, argument) pairs with the opcode stored as a plain int. Lines
+    # holds (instruction, line) for every instruction that starts a new line.
+    def __init__(self, name: str, args: list = [], size: int = 0):
+        self.name = name
+        self.args = args
+        self.size = size
+        self.names = list(args) + [None] * (size - len(args))
+        self.instructions = []
+        self.consts = []
+        self.lines = []
+
+    def line(self, pc: int):
+        # The source line of the instruction at pc, only looked up for errors
+        idx = bisect_right(self.lines, (pc, float('inf'))) - 1
+        return self.lines[idx][1] if idx >= 0 else None
+
+    def disassemble(self, indent: int = 0):
+        lines = [f'{" " * indent}{self.name} ({", ".join(self.args)}) slots={self.size}']
+        starts = dict(self.lines)
+
+        for idx, (op, arg) in enumerate(self.instructions):
+            opcode = OpCode(op)
+            if opcode in [OpCode.LOAD_CONST, OpCode.MAKE_FUNCTION]:
+                const = self.consts[arg]
+                arg = f'{arg} ({const.name if isinstance(const, Code) else repr(const)})'
+            lines.append(f'{" " * indent}{starts.get(idx, ""):>4} {idx:>6} {opcode.name:<14} {"" if arg == None else arg}')
+
+        for const in self.consts:
+            if isinstance(const, Code):
+                lines.append(const.disassemble(indent + 4))
+
+        return '\n'.join(lines)
+
+class Compiler:
+    def __init__(self, globals: list = []):
+        self.globals = globals
+        self.code = None
+        self.loops = []
+        self.line = 1
+
+    def compile(self, ast):
+        size = Resolver(self.globals).resolve(ast)
+        code = Code('<module>', [], size)
+        self.code = code
+
+        if isinstance(ast, list):
+            self.compileBlock(ast)
+
+        self.emit(OpCode.LOAD_CONST, self.const(None))
+        self.emit(OpCode.RETURN)
+
+        return code
+
+    def emit(self, op: OpCode, arg = None):
+        code = self.code
+        if len(code.lines) == 0 or code.lines[-1][1] != self.line:
+            code.lines.append((len(code.instructions), self.line))
+
+        code.instructions.append((op.value, arg))
+        return len(code.instructions) - 1
+
+    def at(self, node: Node):
+        # Instructions emitted from here on come from the line node is on
+        if node.line != None:
+            self.line = node.line
+
+    def patch(self, idx: int, target: int = None):
+        op, _ = self.code.instructions[idx]
+        self.code.instructions[idx] = (op, len(self.code.instructions) if target == None else target)
+
+    def const(self, value):
+        self.code.consts.append(value)
+        return len(self.code.consts) - 1
+
+    def compileBlock(self, block: list):
+        for stmt in block:
+            self.compileStatement(stmt)
+
+    def compileLoad(self, node):
+        if node.depth == None:
+            self.emit(OpCode.LOAD_GLOBAL, node.name)
+        elif node.depth == 0:
+            self.code.names[node.slot] = node.name
+            self.emit(OpCode.LOAD_LOCAL, node.slot)
+        else:
+            self.emit(OpCode.LOAD_DEREF, (node.depth, node.slot, node.name))
+
+    def compileStore(self, node):
+        name = node.name if node.type == NodeType.VarNode else node.identifier
+
+        if node.depth == None:
+            self.emit(OpCode.STORE_GLOBAL, name)
+        elif node.depth == 0:
+            self.code.names[node.slot] = name
+            self.emit(OpCode.STORE_LOCAL, node.slot)
+        else:
+            self.emit(OpCode.STORE_DEREF, (node.depth, node.slot))
+
+    def compileStatement(self, statement: Node):
+        self.at(statement)
+
+        if statement.type == NodeType.VarNode:
+            self.compileExpression(statement.value)
+            self.compileStore(statement)
+
+        elif statement.type == NodeType.DSONode:
+            self.compileExpression(statement.name)
+            for node in statement.path[:-1]:
+                self.compileExpression(node)
+                self.emit(OpCode.INDEX)
+
+            self.compileExpression(statement.path[-1])
+            self.compileExpression(statement.value)
+            self.emit(OpCode.STORE_INDEX)
+
+        elif statement.type == NodeType.ReturnNode:
+            self.compileExpression(statement.returnValue)
+            self.emit(OpCode.RETURN)
+        elif statement.type == NodeType.BreakNode:
+            # A for loop keeps its iterator on the stack
+            if self.loops[-1][0] == NodeType.ForLoopNode:
+                self.emit(OpCode.POP)
+            self.loops[-1][1].append(self.emit(OpCode.JUMP))
+        elif statement.type == NodeType.ContinueNode:
+            self.emit(OpCode.JUMP, self.loops[-1][2])
+
+        elif statement.type == NodeType.ImportNode:
+            self.compileExpression(statement.path)
+            self.emit(OpCode.IMPORT)
+
+        elif statement.type == NodeType.FunctionCallNode:
+            self.compileExpression(statement)
+            self.emit(OpCode.POP)
+        elif statement.type == NodeType.IfStatementNode:
+            self.compileIfStatementNode(statement)
+        elif statement.type == NodeType.WhileLoopNode:
+            self.compileWhileLoopNode(statement)
+        elif statement.type == NodeType.ForLoopNode:
+            self.compileForLoopNode(statement)
+
+    def compileExpression(self, expression: Node):
+        if expression.type in [NodeType.NumberNode, NodeType.NullNode, NodeType.BooleanNode, NodeType.StringNode]:
+            self.emit(OpCode.LOAD_CONST, self.const(getValueFromNode(expression)))
+        elif expression.type == NodeType.VarGetNode:
+            self.compileLoad(expression)
+        elif expression.type == NodeType.BinOpNode:
+            self.compileExpression(expression.left)
+            self.compileExpression(expression.right)
+            self.emit(OpCode.BINARY, expression.op.value)
+        elif expression.type == NodeType.CondNode:
+            self.compileExpression(expression.left)
+            self.compileExpression(expression.right)
+            self.emit(OpCode.COMPARE, expression.op.value)
+        elif expression.type == NodeType.UnOpNode:
+            self.compileExpression(expression.node)
+            self.emit(OpCode.NEGATE)
+        elif expression.type == NodeType.LengthOpNode:
+            self.compileExpression(expression.val)
+            self.emit(OpCode.LENGTH)
+        elif expression.type == NodeType.ArrayNode:
+            for value in expression.value:
+                self.compileExpression(value)
+            self.emit(OpCode.BUILD_ARRAY, len(expression.value))
+        elif expression.type == NodeType.FormatNode:
+            for part in expression.parts:
+                self.compileExpression(part)
+            self.emit(OpCode.FORMAT, len(expression.parts))
+        elif expression.type == NodeType.ObjectNode:
+            for value in expression.value.values():
+                self.compileExpression(value)
+            self.emit(OpCode.BUILD_OBJECT, tuple(key.value for key in expression.value.keys()))
+        elif expression.type == NodeType.IndexNode:
+            # The whole path is looked up at once, so the VM finds self the
+            # way the tree-walker does
+            self.compileExpression(expression.name)
+            for node in expression.path:
+                self.compileExpression(node)
+            self.emit(OpCode.INDEX_PATH, len(expression.path))
+        elif expression.type == NodeType.FunctionCallNode:
+            self.compileExpression(expression.name)
+            for arg in expression.args:
+                self.compileExpression(arg)
+            self.emit(OpCode.CALL, len(expression.args))
+        elif expression.type == NodeType.FunctionNode:
+            self.emit(OpCode.MAKE_FUNCTION, self.const(self.compileFunctionNode(expression)))
+
+    def compileFunctionNode(self, node: FunctionNode):
+        code = Code('<function>', [arg.value for arg in node.args], node.size)
+
+        last_code = self.code
+        last_loops = self.loops
+        last_line = self.line
+        self.code = code
+        self.loops = []
+
+        self.compileBlock(node.block)
+        self.emit(OpCode.LOAD_CONST, self.const(None))
+        self.emit(OpCode.RETURN)
+
+        self.code = last_code
+        self.loops = last_loops
+        self.line = last_line
+
+        return code
+
+    def compileIfStatementNode(self, node: IfStatementNode):
+        ends = []
+
+        for branch in [node] + node.elifs:
+            self.at(branch)
+            self.compileExpression(branch.condition)
+            skip = self.emit(OpCode.JUMP_IF_FALSE)
+
+            if branch.slots:
+                self.emit(OpCode.CLEAR, tuple(branch.slots))
+            self.compileBlock(branch.body)
+            ends.append(self.emit(OpCode.JUMP))
+
+            self.patch(skip)
+
+        if node._else != None:
+            if node._else.slots:
+                self.emit(OpCode.CLEAR, tuple(node._else.slots))
+            self.compileBlock(node._else.body)
+
+        for end in ends:
+            self.patch(end)
+
+    def compileWhileLoopNode(self, node: WhileLoopNode):
+        if node.slots:
+            self.emit(OpCode.CLEAR, tuple(node.slots))
+
+        start = len(self.code.instructions)
+        self.compileExpression(node.condition)
+        exit = self.emit(OpCode.JUMP_IF_FALSE)
+
+        self.loops.append((NodeType.WhileLoopNode, [], start))
+        self.compileBlock(node.body)
+        self.emit(OpCode.JUMP, start)
+
+        self.patch(exit)
+        for brk in self.loops.pop()[1]:
+            self.patch(brk)
+
+    def compileForLoopNode(self, node: ForLoopNode):
+        self.compileExpression(node.start)
+        if node.end != None:
+            self.compileExpression(node.end)
+            if node.step != None:
+                self.compileExpression(node.step)
+            else:
+                self.emit(OpCode.LOAD_CONST, self.const(1.0))
+            self.emit(OpCode.ITER_RANGE)
+        else:
+            self.emit(OpCode.ITER_DS)
+
+        if node.slots:
+            self.emit(OpCode.CLEAR, tuple(node.slots))
+
+        start = self.emit(OpCode.FOR_ITER)
+        self.compileStore(node)
+
+        self.loops.append((NodeType.ForLoopNode, [], start))
+        self.compileBlock(node.body)
+        self.emit(OpCode.JUMP, start)
+
+        self.patch(start)
+        for brk in self.loops.pop()[1]:
+            self.patch(brk)
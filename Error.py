@@ -10,11 +10,27 @@ class ErrorType(Enum):
     VariableError = 4
     FunctionArgumentError = 5
     TypeError = 6
+    IndexError = 7
+    ImportError = 8
+    CallDepthError = 9
+    LoopStepError = 10
     
 
+class EPLError(Exception):
+    # What every error below raises. Code that doesn't know the line leaves it
+    # as None, the engine running the statement fills it in on the way out.
+    def __init__(self, type: ErrorType, message: str, line: int = None):
+        super().__init__(type, message, line)
+        self.type = type
+        self.message = message
+        self.line = line
+
+    def __str__(self):
+        return f'{self.type.name} LINE {self.line}: {self.message}'
+
 class BaseError:
-    def __init__(self, type: ErrorType, message: str = 'Base Unknown Error Case', line: int=1):
-        raise Exception(f'{type.name} LINE {line}: {message}')
+    def __init__(self, type: ErrorType, message: str = 'Base Unknown Error Case', line: int = None):
+        raise EPLError(type, message, line)
 
 class InvalidCharacterError(BaseError):
     def __init__(self, character: str, line: int):
@@ -23,43 +39,67 @@ class InvalidCharacterError(BaseError):
         super().__init__(ErrorType.InvalidCharacterError, message, line)
 
 class InvalidSyntaxError(BaseError):
-    def __init__(self, Token: object, line: int=1, extraMessage: str=''):
+    def __init__(self, Token: object, line: int = None, extraMessage: str=''):
         message = f'Illegal Syntax Occured "{Token.type.name} : {Token.value}". {extraMessage}'
 
         super().__init__(ErrorType.InvalidSyntaxError, message, line)
 
 class DivisionByZeroError(BaseError):
-    def __init__(self, line: int=1):
+    def __init__(self, line: int = None):
         message = 'Cannot divide by 0, result undefined.'
 
         super().__init__(ErrorType.DivisionByZeroError, message, line)
 
 class InvalidConditionOperatorError(BaseError):
-    def __init__(self, tokenType: object, line: int=1):
+    def __init__(self, tokenType: object, line: int = None):
         message = f'Invalid Operator in Condition detected "{tokenType.name}".'
 
         super().__init__(ErrorType.InvalidConditionOperatorError, message, line)
 
 class VariableError(BaseError):
-    def __init__(self, varName: str, line: int=1):
+    def __init__(self, varName: str, line: int = None):
         message = f'Variable {varName} already exists.'
 
         super().__init__(ErrorType.VariableError, message, line)
 
 class VariableUnexistentError(BaseError):
-    def __init__(self, varName: str, line: int=1):
+    def __init__(self, varName: str, line: int = None):
         message = f'Variable {varName} does not exist.'
 
         super().__init__(ErrorType.VariableError, message, line)
 
 class FunctionArgumentError(BaseError):
-    def __init__(self, numOfArguments, numOfParamaters, line: int=1):
+    def __init__(self, numOfArguments, numOfParamaters, line: int = None):
         message = f'Number of Arguments {numOfArguments} does not match with number of paramaters {numOfParamaters}.'
 
         super().__init__(ErrorType.FunctionArgumentError, message, line)
 
 class TypeError(BaseError):
-    def __init__(self, type: Enum, expectedType: Enum, line: int = 1):
-        message = f'Wrong Type {type.name}, expected {expectedType.name}.'
+    def __init__(self, type: Enum, expectedType: Enum, line: int = None):
+        message = f'Wrong Type {type.name if type != None else "Unknown"}, expected {expectedType.name}.'
 
         super().__init__(ErrorType.TypeError, message, line)
+
+class IndexError(BaseError):
+    def __init__(self, index, length: int, line: int = None):
+        message = f'Index {index} is out of range for array of length {length}.'
+
+        super().__init__(ErrorType.IndexError, message, line)
+
+class ImportError(BaseError):
+    def __init__(self, cycle: list, line: int = None):
+        message = f'Import cycle detected {" -> ".join(cycle)}.'
+
+        super().__init__(ErrorType.ImportError, message, line)
+
+class CallDepthError(BaseError):
+    def __init__(self, line: int = None):
+        message = 'Maximum call depth exceeded, too many calls that have not returned yet.'
+
+        super().__init__(ErrorType.CallDepthError, message, line)
+
+class LoopStepError(BaseError):
+    def __init__(self, line: int = None):
+        message = 'The step of a for loop cannot be 0.'
+
+        super().__init__(ErrorType.LoopStepError, message, line)
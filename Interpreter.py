@@ -1,87 +1,319 @@
-from Lexer import Token, TokenType, Lexer
-from Parser import Parser, Node, NodeType, Global, FunctionNode, VarGetNode, GlobalNode, AttachNode, ReturnNode, FunctionCallNode, VarNode
+from Lexer import TokenType
+from Parser import Node, NodeType, FunctionNode, GlobalNode, getNodeTypeFromValue, plain
+from Builtins import BUILTINS
 
-from time import sleep, time
-from random import randint
+from Resolver import Resolver
+import Cache
+from Modules import ModuleRegistry
 
 from Error import *
 
+import sys
+import threading
+from types import CoroutineType
 
 def copy(obj):
     return type(obj)(obj)
 
-def convert(val: Node):
-    if val.type == NodeType.NumberNode:
-        return float(val.value)
-    elif val.type == NodeType.StringNode:
-        return str(val.value)
-    elif val.type == NodeType.BooleanNode:
-        return bool(val.value)
-    elif val.type == NodeType.NullNode:
+NUMBERS = [float, int]
+
+# Marks a slot whose variable hasn't been assigned, None is null
+EMPTY = object()
+
+# What a statement returns when it stops the blocks around it early, every
+# other statement returns None. The value of a return is left in
+# Interpreter.result, for a tail call the function and its arguments are.
+RETURN = 1
+BREAK = 2
+TAIL_CALL = 3
+CONTINUE = 4
+
+# Raised when a builtin that has to wait, like the ones from
+# Builtins.asynchronous, is called outside of VM.runAsync
+WAITING_BUILTIN = 'A builtin had to wait, scripts calling waiting builtins run with VM.runAsync.'
+
+# Python frames the interpreter may nest, a call between EPL functions takes
+# around eight. Python recurses on the C stack for some builtins too and
+# crashes instead of raising when that overflows, so this stays well short.
+RECURSION_LIMIT = 30000
+
+# The limit is only raised while a script runs on some thread and put back
+# once none does, hosts keep their own limit otherwise
+running = 0
+previousLimit = None
+limitLock = threading.Lock()
+
+def raiseLimit():
+    global running, previousLimit
+    with limitLock:
+        if running == 0:
+            previousLimit = sys.getrecursionlimit()
+            sys.setrecursionlimit(max(previousLimit, RECURSION_LIMIT))
+        running += 1
+
+def restoreLimit():
+    global running
+    with limitLock:
+        running -= 1
+        if running == 0:
+            sys.setrecursionlimit(previousLimit)
+
+def convert(val):
+    # What a value is compared as, arrays, objects and functions as None
+    if type(val) in NUMBERS:
+        return float(val)
+    elif type(val) in [str, bool]:
+        return val
+    elif val is None:
         return 0
 
-class Stack:
-    def __init__(self):
-        self.stack = []
+# Operators on evaluated values, shared by the Interpreter and the VM
 
-    def push(self, value):
-        self.stack.append(value)
-        return value
-    
-    def pop(self):
-        return self.stack.pop()
+def text(value):
+    # How a value reads inside a string, whole numbers lose their ".0"
+    if type(value) in NUMBERS and float(value).is_integer():
+        return str(int(value))
+
+    return str(plain(value))
+
+def interpolate(parts: list):
+    return ''.join([text(part) for part in parts])
+
+def unop(val):
+    if type(val) is bool:
+        return not val
+
+    return -plain(val)
+
+def binop(op: TokenType, left, right):
+    if type(left) is str or type(right) is str:
+        if op == TokenType.PLUS:
+            return text(left) + text(right)
+        return 0
 
-    def size(self):
-        return len(self.stack)
+    if not type(left) in NUMBERS:
+        left = plain(left)
+    if not type(right) in NUMBERS:
+        right = plain(right)
+
+    if op == TokenType.PLUS:
+        return left + right
+    elif op == TokenType.MINUS:
+        return left - right
+    elif op == TokenType.MULTIPLY:
+        return left * right
+    elif op == TokenType.DIVIDE:
+        if right == 0:
+            DivisionByZeroError()
+        return left / right
+    elif op == TokenType.POWER:
+        return left ** right
+
+    return 0
+
+def compare(op: TokenType, left, right):
+    if op == TokenType.AND or op == TokenType.OR:
+        if type(left) is not bool or type(right) is not bool:
+            InvalidConditionOperatorError(op)
+
+        if op == TokenType.AND:
+            return left and right
+        return left or right
+
+    if not (type(left) in NUMBERS and type(right) in NUMBERS):
+        left = convert(left)
+        right = convert(right)
+
+    if op == TokenType.EEQ:
+        return left == right
+    elif op == TokenType.NQ:
+        return left != right
+    elif op == TokenType.LT:
+        return left < right
+    elif op == TokenType.LTE:
+        return left <= right
+    elif op == TokenType.GT:
+        return left > right
+    elif op == TokenType.GTE:
+        return left >= right
+
+    InvalidConditionOperatorError(op)
+
+def counted(start, end, step = 1.0):
+    # The numbers a for loop counts through, from start to end inclusive. Start
+    # and end are cut down to whole numbers and a loop that starts at or past
+    # its end doesn't run. Whole steps count with a lazy range, fractional
+    # ones from start every time so they don't drift.
+    for value in [start, end, step]:
+        if not type(value) in NUMBERS:
+            TypeError(getNodeTypeFromValue(value), NodeType.NumberNode)
+
+    if step == 0:
+        LoopStepError()
+
+    if (step > 0 and start >= end) or (step < 0 and start <= end):
+        return iter(())
+
+    start = int(start)
+    end = int(end)
+
+    if step == int(step):
+        return map(float, range(start, end + (1 if step > 0 else -1), int(step)))
+
+    return (start + idx * step for idx in range(int((end - start) / step + 1e-9) + 1))
+
+def length(value):
+    if type(value) in NUMBERS:
+        return value
+    elif type(value) in [list, dict, str]:
+        return len(value)
+    else:
+        return None
 
 class Environment:
-    def __init__(self, interpreter, globals: dict = {}, stack: Stack = Stack(), loop: Stack = Stack()):
-        self.symbolTable = globals.copy()
-        self.globals = globals.copy()
+    def __init__(self, interpreter, parent = None, globals: dict = {}, size: int = 0, names: list = [], caller = None):
+        # One environment per function call. Locals live in fixed slots handed
+        # out by the Resolver, globals in the symbol table of the module the
+        # chain starts from. An empty slot holds EMPTY. names has the name of
+        # every slot and caller is the environment the call was made from.
+        # borrowed lists the caller variables this call has read into its own
+        # slots, as (slot, environment, slot there).
+        self.slots = [EMPTY] * size
+        self.names = names
+        self.parent = parent
+        self.caller = caller
+        self.borrowed = None
         self.interpreter = interpreter
-        self.fstack = stack
-        self.lstack = loop
+
+        if parent != None:
+            self.symbolTable = parent.symbolTable
+            self.globals = parent.globals
+        else:
+            self.symbolTable = globals.copy()
+            self.globals = globals.copy()
     
     def get(self, name):
         if name == 'self':
-            return SELF
+            if self.interpreter.SELF is None:
+                VariableUnexistentError(name)
+            return self.interpreter.SELF
         if name in self.symbolTable:
             node = self.symbolTable[name]
             return node
-        else:
-            VariableUnexistentError(name, self.interpreter.current_line)
+
+        # A name the function neither has nor closes over, and that isn't a
+        # global, is one of its caller's variables
+        env, slot = self.callerSlot(name)
+        if env == None:
+            VariableUnexistentError(name)
+
+        return env.slots[slot]
+
+    def callerSlot(self, name):
+        # Searches the callers outwards, each with the scopes it closes over,
+        # for the environment and slot holding name. The newest slot of a
+        # name is the one of the innermost block.
+        caller = self.caller
+        while caller != None:
+            env = caller
+            while env != None:
+                names = env.names
+                for slot in range(len(names) - 1, -1, -1):
+                    if names[slot] == name and env.slots[slot] is not EMPTY:
+                        return env, slot
+                env = env.parent
+
+            caller = caller.caller
+
+        return None, None
+
+    def borrow(self, slot):
+        # A local read before it is assigned is the caller's variable of the
+        # same name. It is copied into the slot and written back by giveBack
+        # when the call returns, so count += 1 updates the caller's count.
+        name = self.names[slot]
+        env, found = self.callerSlot(name)
+        if env == None:
+            VariableUnexistentError(name)
+
+        if self.borrowed == None:
+            self.borrowed = []
+        self.borrowed.append((slot, env, found))
+
+        value = self.slots[slot] = env.slots[found]
+        return value
+
+    def giveBack(self):
+        for slot, env, found in self.borrowed:
+            value = self.slots[slot]
+            if value is not EMPTY:
+                env.slots[found] = value
     
     def set(self, name, value):
         self.symbolTable[name] = value
+
+    def load(self, node):
+        depth = node.depth
+        if depth == 0:
+            value = self.slots[node.slot]
+            if value is EMPTY:
+                return self.borrow(node.slot)
+            return value
+        elif depth == None:
+            return self.get(node.name)
+        else:
+            env = self.parent
+            while depth > 1:
+                env = env.parent
+                depth -= 1
+
+            value = env.slots[node.slot]
+
+        if value is EMPTY:
+            VariableUnexistentError(node.name)
+
+        return value
+
+    def store(self, node, value):
+        depth = node.depth
+        if depth == 0:
+            self.slots[node.slot] = value
+        elif depth == None:
+            self.symbolTable[node.name] = value
+        else:
+            env = self.parent
+            while depth > 1:
+                env = env.parent
+                depth -= 1
+
+            env.slots[node.slot] = value
+
+    def clear(self, slots):
+        for slot in slots:
+            self.slots[slot] = EMPTY
     
     def index(self, name, path):
-        global SELF
         var = None
         if isinstance(name, Node):
             var = self.interpreter.visitExpression(name)
         else:
             var = self.get(name)
 
-        obj = None
-        lastObj = var
+        return self.walk(var, [self.interpreter.visitExpression(node) for node in path])
 
-        if var.type == NodeType.StringNode:
-            if len(path) > 1:
-                return Node(NodeType.NullNode)
-            else:
-                return Node(NodeType.StringNode, var.value[int(self.interpreter.visitExpression(path[0]).value)])
-    
-        for node in path:
-            if obj == None:
-                obj = var.value[self.interpreter.visitExpression(node)]
-            else:
-                obj = obj.value[self.interpreter.visitExpression(node)]
-                if obj.type == NodeType.ObjectNode:
-                    lastObj = obj
-        
-        obj = self.interpreter.visitExpression(obj)
-        if (obj.type == NodeType.FunctionNode and lastObj.type == NodeType.ObjectNode):
-            SELF = lastObj
+    def walk(self, obj, keys):
+        # Indexes obj with each key in turn, for both engines. A function
+        # reached this way is a method of the innermost object on the way to
+        # it, which becomes self.
+        holder = None
+
+        for key in keys:
+            if type(obj) is dict:
+                holder = obj
+            obj = self.getitem(obj, key)
+
+        if type(obj) is FunctionNode and holder is not None:
+            self.interpreter.SELF = holder
 
         return obj
     
@@ -93,481 +325,455 @@ class Environment:
             obj = self.get(name)
 
         if len(path) > 1:
-            obj = obj.value[self.interpreter.visitExpression(path[0])]
+            obj = self.getitem(obj, self.interpreter.visitExpression(path[0]))
             if len(path) > 2:
                 for node in path[1:-1]:
-                    obj = obj.value[self.interpreter.visitExpression(node)]
+                    obj = self.getitem(obj, self.interpreter.visitExpression(node))
+
+        self.setitem(obj, self.interpreter.visitExpression(path[-1]), self.interpreter.visitExpression(value))
+
+    def arrayindex(self, key):
+        if not type(key) in NUMBERS:
+            TypeError(getNodeTypeFromValue(key), NodeType.NumberNode)
+
+        return int(key)
 
-        obj.value[self.interpreter.visitExpression(path[-1])] = self.interpreter.visitExpression(value)
+    def getitem(self, obj, key):
+        if type(obj) is list:
+            idx = self.arrayindex(key)
+            if idx < 0 or idx >= len(obj):
+                IndexError(idx, len(obj))
+
+            return obj[idx]
+        elif type(obj) is str:
+            return obj[self.arrayindex(key)]
+
+        return obj[key]
+
+    def setitem(self, obj, key, value):
+        if type(obj) is list:
+            idx = self.arrayindex(key)
+            if idx < 0:
+                IndexError(idx, len(obj))
+
+            # Writing past the end grows the array, padding any gap with null
+            if idx >= len(obj):
+                obj.extend([None] * (idx - len(obj)))
+                obj.append(value)
+            else:
+                obj[idx] = value
+        else:
+            obj[key] = value
     
     def funarg(self, args, val):
         idx = 0
         for arg in args:
-            self.set(arg.value, self.interpreter.visitExpression(val[idx]))
+            self.slots[idx] = val[idx]
             idx += 1
-        
-    def copy(self):
-        return Environment(self.interpreter, self.symbolTable.copy(), self.fstack, self.lstack)
-
-    def differ(self, env2):
-        resEnv = {}
-
-        for name, node in self.symbolTable.items():
-            if name in env2.symbolTable:
-                resEnv[name] = self.interpreter.visitExpression(node)
-        
-        self.symbolTable = resEnv
     
     def diffimport(self, env2):
         resEnv = self.symbolTable
 
         for name, node in env2.symbolTable.items():
             if not (name in resEnv):
-                resEnv[name] = self.interpreter.visitExpression(node)
+                resEnv[name] = node
         
         self.symbolTable = resEnv
     
     def remglobals(self, obj):
-        resEnv = {}
-
-        for i, v in obj.value.items():
-            if not (i.value in self.globals):
-                resEnv[i] = v
-        
-        obj.value = resEnv
+        for name in [name for name in obj if name in self.globals]:
+            del obj[name]
 
 class Interpreter:
-    def __init__(self, ast):
+    def __init__(self, ast: list = None, builtins: dict = BUILTINS):
         self.nodes = ast
 
-        self.current_line = 1
+        # Every node type maps straight to its visitor, types with nothing
+        # to do map to visitNothing
+        self.statements = {nodeType: self.visitNothing for nodeType in NodeType}
+        self.statements.update({
+            NodeType.VarNode: self.visitVarCreateNode,
+            NodeType.DSONode: self.visitDSONode,
+            NodeType.ReturnNode: self.visitReturnNode,
+            NodeType.BreakNode: self.visitBreakNode,
+            NodeType.ContinueNode: self.visitContinueNode,
+            NodeType.ImportNode: self.visitImportNode,
+            NodeType.FunctionCallNode: self.visitCallStatement,
+            NodeType.IfStatementNode: self.visitIfStatementNode,
+            NodeType.WhileLoopNode: self.visitWhileLoopNode,
+            NodeType.ForLoopNode: self.visitForLoopNode
+        })
+
+        self.expressions = {nodeType: self.visitNothing for nodeType in NodeType}
+        self.expressions.update({
+            NodeType.NumberNode: self.visitValue,
+            NodeType.NullNode: self.visitNullNode,
+            NodeType.BooleanNode: self.visitValue,
+            NodeType.StringNode: self.visitValue,
+            NodeType.ClassNode: self.visitNode,
+            NodeType.FunctionNode: self.visitFunctionNode,
+            NodeType.ObjectNode: self.visitDSExpression,
+            NodeType.ArrayNode: self.visitDSExpression,
+            NodeType.BinOpNode: self.visitBinOpNode,
+            NodeType.UnOpNode: self.visitUnOpNode,
+            NodeType.CondNode: self.visitCondNode,
+            NodeType.FunctionCallNode: self.visitFunctionCallNode,
+            NodeType.VarGetNode: self.visitVarGetNode,
+            NodeType.IndexNode: self.visitIndexNode,
+            NodeType.LengthOpNode: self.visitLengthOpNode,
+            NodeType.FormatNode: self.visitFormatNode
+        })
+
+        # The object the last method was looked up on, what self refers to
+        self.SELF = None
+        # What the last return statement returned
+        self.result = None
+
         self.current_env = Environment(self)
-        self.globals = {
-            'log': self.visitExpression(GlobalNode(Global.Log)),
-            'sleep': self.visitExpression(GlobalNode(Global.Sleep)),
-            'time': self.visitExpression(GlobalNode(Global.Time)),
-            'input': self.visitExpression(GlobalNode(Global.Input)),
-            'random': self.visitExpression(GlobalNode(Global.Random)),
-            'tonumber': self.visitExpression(GlobalNode(Global.ToNumber)),
-            'tostring': self.visitExpression(GlobalNode(Global.ToString))
-        }
+        self.globals = dict(builtins)
         self.current_env.symbolTable = self.globals.copy()
         self.current_env.globals = self.globals.copy()
+        resolver = Resolver(self.globals.keys())
+        self.current_env.slots = [EMPTY] * resolver.resolve(ast)
+        self.current_env.names = resolver.names
+        self.root_env = self.current_env
+        self.modules = ModuleRegistry(self.runModule)
+        # Imported files as (ast, size, names), read and resolved once, every
+        # run only executes them again
+        self.parsed = {}
+        self.optimize = False
     
     def evaluate(self):
-        self.visitBlock(self.nodes, True)
+        raiseLimit()
+        try:
+            self.visitBlock(self.nodes)
+        finally:
+            restoreLimit()
+
+    def run(self, program, inputs: dict = None):
+        # Runs a Program from Program.compile in a top level scope of its own,
+        # so nothing one run assigns is seen by the next. Imports run again
+        # for every run too, modules can hold state that scripts change, but
+        # their files are only read the first time.
+        # inputs are set as globals first, the scope is returned for reading
+        # results.
+        env = Environment(self, None, self.globals, size=program.size, names=program.names)
+        if inputs != None:
+            env.symbolTable.update(inputs)
+
+        self.modules.invalidate()
+        self.SELF = None
+        self.result = None
+
+        last_env = self.current_env
+        self.current_env = env
+        self.root_env = env
+
+        raiseLimit()
+        try:
+            self.visitBlock(program.ast)
+        finally:
+            self.current_env = last_env
+            restoreLimit()
+
+        return env
     
-    def visitBlock(self, block, main: bool = False):
-        for stmt in block:
-            if self.current_env.fstack.size() != 0:
-                break
-            if self.current_env.lstack.size() != 0:
-                break
-
-            self.visitStatement(stmt, main)
+    def visitBlock(self, block):
+        # Returns the status of the statement that stopped the block early,
+        # or None when it ran to the end
+        statements = self.statements
+
+        try:
+            for stmt in block:
+                status = statements[stmt.type](stmt)
+                if status:
+                    return status
+        except EPLError as error:
+            # The innermost statement running when the error happened has its line
+            if error.line == None:
+                error.line = stmt.line
+            raise
     
-    def visitStatement(self, statement: Node, main: bool = False):
-        if statement.type == NodeType.VarNode:
-            self.visitVarCreateNode(statement)
-        
-        elif statement.type == NodeType.DSONode:
-            self.current_env.dso(statement.name, statement.path, statement.value)
-    
-        elif statement.type == NodeType.ReturnNode:
-            self.current_env.fstack.push(self.visitExpression(statement.returnValue))
-        elif statement.type == NodeType.BreakNode:
-            self.current_env.lstack.push(0)
+    def visitStatement(self, statement: Node):
+        return self.statements[statement.type](statement)
 
-        elif statement.type == NodeType.AttachNode:
-            statement.function()
-        
-        elif statement.type == NodeType.NewLineNode:
-            self.current_line += 1
-        
-        elif statement.type == NodeType.ImportNode:
-            self.visitImportNode(statement)
-
-        elif statement.type == NodeType.FunctionCallNode:
-            return self.visitFunctionCallNode(statement)
-        elif statement.type == NodeType.IfStatementNode:
-            return self.visitIfStatementNode(statement)
-        elif statement.type == NodeType.WhileLoopNode:
-            return self.visitWhileLoopNode(statement)
-        elif statement.type == NodeType.ForLoopNode:
-            return self.visitForLoopNode(statement)
-    
-    def visitGlobalNode(self, node: Node):
-        func = None
-
-        if node.gType == Global.Log:
-            def attach(name):
-                def func():
-                    arg = self.visitExpression(name).value
-                    print(arg)
-                
-                return func
-
-            func = FunctionNode([Node(NodeType.StringNode, '!')], [
-                AttachNode(attach((VarGetNode('!'))))
-            ])
-        elif node.gType == Global.Sleep:
-            def attach(value):
-                def func():
-                    arg = self.visitExpression(value).value
-                    sleep(arg)
-            
-                return func
-
-            func = FunctionNode([Node(NodeType.NumberNode, '!')], [
-                AttachNode(attach(VarGetNode('!')))
-            ])
-        elif node.gType == Global.Time:
-            def attach():
-                def func():
-                    return Node(NodeType.NumberNode, time())
-
-                return func
-
-            func = FunctionNode([], [
-                ReturnNode(AttachNode(attach()))
-            ])
-        elif node.gType == Global.Input:
-            def attach(value):
-                def func():
-                    arg = self.visitExpression(value).value
-                    print(arg, end='')
-                    return Node(NodeType.StringNode, input(''))
-                
-                return func
-            func = FunctionNode([Node(NodeType.StringNode, '!')], [
-                ReturnNode(AttachNode(attach(VarGetNode('!'))))
-            ])
-        elif node.gType == Global.Random:
-            def attach(ax, bx):
-                def func():
-                    a = self.visitExpression(ax).value
-                    b = self.visitExpression(bx).value
-
-                    return Node(NodeType.NumberNode, randint(int(a), int(b)))
-
-                return func
-
-            func = FunctionNode([Node(NodeType.StringNode, '!'), Node(NodeType.StringNode, '!!')], [
-                ReturnNode(AttachNode(attach(VarGetNode('!'), VarGetNode('!!'))))
-            ])
-        
-        elif node.gType == Global.ToNumber:
-            def attach(value):
-                def func():
-                    arg = self.visitExpression(value).value
-                    return Node(NodeType.NumberNode, float(arg))
-                
-                return func
-
-            func = FunctionNode([Node(NodeType.StringNode, '!')], [
-                ReturnNode(AttachNode(attach(VarGetNode('!'))))
-            ])
-        elif node.gType == Global.ToString:
-            def attach(value):
-                def func():
-                    arg = self.visitExpression(value).value
-                    return Node(NodeType.StringNode, str(arg))
-                
-                return func
-
-            func = FunctionNode([Node(NodeType.NumberNode, '!')], [
-                ReturnNode(AttachNode(attach(VarGetNode('!'))))
-            ])
-    
-        return func
+    def visitNothing(self, node: Node):
+        return None
+
+    def visitDSONode(self, node: Node):
+        self.current_env.dso(node.name, node.path, node.value)
+
+    def visitReturnNode(self, node: Node):
+        value = node.returnValue
+
+        # A call in tail position of a function is made by the caller of the
+        # function once it has returned, see call()
+        if value.type == NodeType.FunctionCallNode and self.current_env.parent != None:
+            funNode = self.visitExpression(value.name)
+            args = self.arguments(funNode, value)
+
+            if type(funNode) is GlobalNode:
+                self.result = self.callBuiltin(funNode, args)
+                return RETURN
+
+            self.result = (funNode, args)
+            return TAIL_CALL
+
+        self.result = self.visitExpression(value)
+        return RETURN
+
+    def visitBreakNode(self, node: Node):
+        return BREAK
+
+    def visitContinueNode(self, node: Node):
+        return CONTINUE
+
+    def visitScope(self, block, slots):
+        # Block variables live in the frame, entering the block again starts
+        # them out empty
+        if slots:
+            self.current_env.clear(slots)
+
+        return self.visitBlock(block)
 
     def visitExpression(self, expression: Node):
-        default = [NodeType.NumberNode, NodeType.NullNode, NodeType.BooleanNode, NodeType.StringNode, NodeType.FunctionNode, NodeType.ClassNode]
-
-        if expression.type in default:
-            xp = expression
-            return xp
-        elif expression.type in [NodeType.ObjectNode, NodeType.ArrayNode]:
-            return self.visitDSExpression(expression)
-        elif expression.type == NodeType.BinOpNode:
-            return self.visitBinOpNode(expression)
-        elif expression.type == NodeType.UnOpNode:
-            return self.visitUnOpNode(expression)
-        elif expression.type == NodeType.CondNode:
-            return self.visitCondNode(expression)
-        elif expression.type == NodeType.FunctionCallNode:
-            return self.visitFunctionCallNode(expression)
-        elif expression.type == NodeType.VarGetNode:
-            return self.current_env.get(expression.name)
-        elif expression.type == NodeType.IndexNode:
-            return self.current_env.index(expression.name, expression.path)
-
-        elif expression.type == NodeType.GlobalNode:
-            return self.visitGlobalNode(expression)
-        elif expression.type == NodeType.AttachNode:
-            return expression.function()
-        
-        elif expression.type == NodeType.LengthOpNode:
-            lop = self.visitLengthOpNode(expression)
-            return lop
-    
-    def visitUnOpNode(self, node: Node):
-        val = self.visitExpression(node.node)
+        return self.expressions[expression.type](expression)
+
+    def visitValue(self, node: Node):
+        return node.value
 
-        if val.type == NodeType.BooleanNode:
-            return Node(NodeType.BooleanNode, not val.value)
+    def visitNullNode(self, node: Node):
+        return None
 
-        return Node(NodeType.NumberNode, -val.value)
+    def visitNode(self, node: Node):
+        return node
+
+    def visitFunctionNode(self, node: Node):
+        # Function literals close over the scope they are evaluated in
+        if node.env == None:
+            return FunctionNode(node.args, node.block, self.current_env, node.size, names=node.names)
+        return node
+
+    def visitVarGetNode(self, node: Node):
+        if node.depth == 0:
+            value = self.current_env.slots[node.slot]
+            if value is not EMPTY:
+                return value
+        return self.current_env.load(node)
+
+    def visitIndexNode(self, node: Node):
+        return self.current_env.index(node.name, node.path)
+    
+    def visitFormatNode(self, node: Node):
+        return interpolate([self.visitExpression(part) for part in node.parts])
+
+    def visitUnOpNode(self, node: Node):
+        return unop(self.visitExpression(node.node))
     
     def visitBinOpNode(self, node: Node):
         left = self.visitExpression(node.left)
-        op = node.op
         right = self.visitExpression(node.right)
-        result = Node(NodeType.NumberNode, 0)
-
-        if left.type == NodeType.StringNode or right.type == NodeType.StringNode:
-            if op == TokenType.PLUS:
-                
-                if left.type == NodeType.NumberNode and str(left.value).endswith('.0'):
-                    left.value = str(left.value)[:-2]
-                elif right.type == NodeType.NumberNode and str(right.value).endswith('.0'):
-                    right.value = str(right.value)[:-2]
-
-                result.type = NodeType.StringNode
-                result.value = str(left.value) + str(right.value)
-        else:
-            if op == TokenType.PLUS:
-                result.value = left.value + right.value
-            elif op == TokenType.MINUS:
-                result.value = left.value - right.value
-            elif op == TokenType.MULTIPLY:
-                result.value = left.value * right.value
-            elif op == TokenType.DIVIDE:
-                if right.value == 0:
-                    DivisionByZeroError(self.current_line)
-                result.value = left.value / right.value
-            elif op == TokenType.POWER:
-                result.value = left.value ** right.value
-        
-        return result
+
+        return binop(node.op, left, right)
 
     def visitCondNode(self, node: Node):
         left = self.visitExpression(node.left)
         right = self.visitExpression(node.right)
-        op = node.op
-        resultNode = Node(NodeType.BooleanNode, 0)
-
-        if not (op in [TokenType.AND, TokenType.OR]):
-            left = convert(left)
-            right = convert(right)
-            if op == TokenType.EEQ:
-                if left == right:
-                    resultNode.value = True
-                else:
-                    resultNode.value = False
-            elif op == TokenType.NQ:
-                if left != right:
-                    resultNode.value = True
-                else:
-                    resultNode.value = False
-            elif op == TokenType.LT:
-                if left < right:
-                    resultNode.value = True
-                else:
-                    resultNode.value = False
-            elif op == TokenType.LTE:
-                if left <= right:
-                    resultNode.value = True
-                else:
-                    resultNode.value = False
-            elif op == TokenType.GT:
-                if left > right:
-                    resultNode.value = True
-                else:
-                    resultNode.value = False
-            elif op == TokenType.GTE:
-                if left >= right:
-                    resultNode.value = True
-                else:
-                    resultNode.value = False
-            else:
-                InvalidConditionOperatorError(op, self.current_line)
-        else:
-            if left.type != NodeType.BooleanNode or right.type != NodeType.BooleanNode:
-                InvalidConditionOperatorError(op, self.current_line)
-            
-            left = left.value
-            right = right.value
-
-            if op == TokenType.AND:
-                if left and right:
-                    resultNode.value = True
-                else:
-                    resultNode.value = False
-            else:
-                if left or right:
-                    resultNode.value = True
-                else:
-                    resultNode.value = False
-        
-        return resultNode
+
+        return compare(node.op, left, right)
 
     def visitVarCreateNode(self, node: Node):
-        identifier = node.name
         value = self.visitExpression(node.value)
-        self.current_env.set(identifier, value)
+
+        if node.depth == 0:
+            self.current_env.slots[node.slot] = value
+        else:
+            self.current_env.store(node, value)
     
     def visitFunctionCallNode(self, node: Node):
         funNode = self.visitExpression(node.name)
-        last_enviroment = self.current_env.copy()
-        targetArgs = funNode.args
+        args = self.arguments(funNode, node)
 
-        if len(targetArgs) != len(node.args):
-            FunctionArgumentError(len(targetArgs), len(node.args))
+        if type(funNode) is GlobalNode:
+            return self.callBuiltin(funNode, args)
 
-        self.current_env.funarg(targetArgs, node.args)
+        return self.call(funNode, args)
 
-        if len(funNode.block) > 0:
-            self.visitBlock(funNode.block)
-        
-        if self.current_env.fstack.size() == 0:
-            retVal = Node(NodeType.NullNode, 0)
+    def callBuiltin(self, funNode: GlobalNode, args: list):
+        # Builtins are Python functions, called without a scope of their own.
+        # The tree-walker can't wait for one that returns a coroutine.
+        value = funNode.function(*args)
+        if type(value) is CoroutineType:
+            value.close()
+            raise Exception(WAITING_BUILTIN)
+
+        return value
+
+    def visitCallStatement(self, node: Node):
+        self.visitFunctionCallNode(node)
+
+    def arguments(self, funNode, node: Node):
+        # The evaluated arguments of a call, once there are as many as the
+        # function takes
+        if type(funNode) is GlobalNode:
+            arity = funNode.arity
+        elif type(funNode) is FunctionNode:
+            arity = len(funNode.args)
         else:
-            retVal = self.current_env.fstack.pop()
-        
+            TypeError(getNodeTypeFromValue(funNode), NodeType.FunctionNode)
 
-        retVal = self.visitExpression(retVal)
+        if arity != None and arity != len(node.args):
+            FunctionArgumentError(arity, len(node.args))
 
-        self.current_env.differ(last_enviroment)
+        return [self.visitExpression(arg) for arg in node.args]
 
-        return retVal
+    def call(self, funNode: FunctionNode, args: list):
+        last_env = self.current_env
 
-    def visitIfStatementNode(self, ifst: Node):
-        condition = self.visitExpression(ifst.condition)
+        try:
+            while True:
+                self.current_env = Environment(self, funNode.env or self.root_env, size=funNode.size, names=funNode.names, caller=last_env)
+                self.current_env.funarg(funNode.args, args)
 
-        elifs = []
-        _else = None
+                status = self.visitBlock(funNode.block)
+                if self.current_env.borrowed:
+                    self.current_env.giveBack()
+                if status != TAIL_CALL:
+                    return self.result if status == RETURN else None
 
-        ranElif = False
+                # A tail call runs here in place of the function that made
+                # it, so tail recursion doesn't grow the Python stack
+                funNode, args = self.result
+        except RecursionError:
+            # Raised below, outside the handler, so the error doesn't carry
+            # the whole Python recursion along as its context
+            pass
+        finally:
+            self.current_env = last_env
 
-        lastEnv = self.current_env.copy()
+        CallDepthError()
 
-        if len(ifst.elifs) != 0:
-            for elf in ifst.elifs:
-                elifs.append(elf)
-        
-        if ifst._else != None:
-            _else = ifst._else
+    def visitIfStatementNode(self, ifst: Node):
+        if self.visitExpression(ifst.condition):
+            return self.visitScope(ifst.body, ifst.slots)
 
-        if condition.value:
-            self.visitBlock(ifst.body)
-        else:
-            if len(elifs) > 0:
-                for elf in elifs:
-                    if self.visitExpression(elf.condition).value:
-                        self.visitStatement(elf)
-                        ranElif = True
-            
-            if not ranElif:
-                if _else != None:
-                    self.visitStatement(_else)
-                    return
-    
+        for elf in ifst.elifs:
+            try:
+                taken = self.visitExpression(elf.condition)
+            except EPLError as error:
+                # Else if conditions are on lines of their own
+                if error.line == None:
+                    error.line = elf.line
+                raise
 
-        self.current_env.differ(lastEnv)
+            if taken:
+                return self.visitScope(elf.body, elf.slots)
+
+        if ifst._else != None:
+            return self.visitScope(ifst._else.body, ifst._else.slots)
     
     def visitWhileLoopNode(self, whln: Node):
-        last_env = self.current_env.copy()
+        self.current_env.clear(whln.slots)
 
-        last_lsize = self.current_env.lstack.size()
+        while self.visitExpression(whln.condition):
+            status = self.visitBlock(whln.body)
 
-        while self.visitExpression(whln.condition).value:
-            self.visitBlock(whln.body)
-
-            if self.current_env.lstack.size() > last_lsize:
-                self.current_env.lstack.pop()
-                break
-        
-        self.current_env.differ(last_env)
+            # A break ends only this loop and a continue only this iteration,
+            # anything else ends the blocks around the loop too
+            if status and status != CONTINUE:
+                return status if status != BREAK else None
     
     def visitLengthOpNode(self, node: Node):
-        value = self.visitExpression(node.val)
-
-        if value.type == NodeType.NumberNode:
-            return Node(NodeType.NumberNode, value.value)
-        elif value.type in [NodeType.ArrayNode, NodeType.ObjectNode, NodeType.StringNode]:
-            node = Node(NodeType.NumberNode, len(value.value))
-            return node
-        else:
-            return Node(NodeType.NullNode)
+        return length(self.visitExpression(node.val))
     
     def visitForLoopNode(self, node: Node):
         if node.end != None:
-            # Normal Traditional For Loop
+            # Numeric For Loop
             start = self.visitExpression(node.start)
             end = self.visitExpression(node.end)
+            step = 1.0 if node.step == None else self.visitExpression(node.step)
 
-            if start.type != NodeType.NumberNode or end.type != NodeType.NumberNode:
-                TypeError(start.type if start.type != NodeType.NumberNode else end.type, NodeType.NumberNode, self.current_line)
-            
-            if start.value >= end.value:
-                return
-            
-            last_env = self.current_env.copy()
-            last_lsize = self.current_env.lstack.size()
+            numbers = counted(start, end, step)
+            self.current_env.clear(node.slots)
 
-            for num in range(int(start.value), int(end.value) + 1):
-                self.current_env.set(node.identifier, Node(NodeType.NumberNode, float(num)))
-                self.visitBlock(node.body)
+            # The loop variable is written straight into where it lives, a
+            # slot of this function or an outer one, or the globals
+            if node.depth == None:
+                variables, key = self.current_env.symbolTable, node.identifier
+            else:
+                env = self.current_env
+                for _ in range(node.depth):
+                    env = env.parent
+                variables, key = env.slots, node.slot
+
+            body = node.body
+            visitBlock = self.visitBlock
 
-                if self.current_env.lstack.size() > last_lsize:
-                    self.current_env.lstack.pop()
-                    break 
+            for variables[key] in numbers:
+                status = visitBlock(body)
 
-            self.current_env.differ(last_env)
+                if status and status != CONTINUE:
+                    return status if status != BREAK else None
         else:
             # DS For Loop
             dstruct = self.visitExpression(node.start)
 
-            if not (dstruct.type in [NodeType.ObjectNode, NodeType.ArrayNode]):
-                TypeError(dstruct.type, NodeType.ArrayNode, self.current_line)
+            if not (type(dstruct) in [dict, list]):
+                TypeError(getNodeTypeFromValue(dstruct), NodeType.ArrayNode)
 
-            last_env = self.current_env.copy()
-            last_lsize = self.current_env.lstack.size()
+            self.current_env.clear(node.slots)
 
-            for key, value in dstruct.value.items():
-                data = Node(NodeType.ObjectNode, {
-                    Node(NodeType.StringNode, "key"): self.visitExpression(key),
-                    Node(NodeType.StringNode, "value"): self.visitExpression(value)
-                })
+            items = enumerate(dstruct) if type(dstruct) is list else dstruct.items()
 
-                self.current_env.set(node.identifier, data)
-                self.visitBlock(node.body)
+            for key, value in items:
+                self.current_env.store(node, {'key': key, 'value': value})
+                status = self.visitBlock(node.body)
 
-                if self.current_env.lstack.size() > last_lsize:
-                    self.current_env.lstack.pop()
-                    break
-            
-            self.current_env.differ(last_env)
+                if status and status != CONTINUE:
+                    return status if status != BREAK else None
     
     
     def visitDSExpression(self, expression):
+        if expression.type == NodeType.ArrayNode:
+            return [self.visitExpression(v) for v in expression.value]
+
         newValue = {}
 
         for k, v in expression.value.items():
-            newValue[k] = self.visitExpression(v)
+            newValue[k.value] = self.visitExpression(v)
         
-        return Node(expression.type, newValue)
+        return newValue
 
     def visitImportNode(self, node: Node):
-        file = open(self.visitExpression(node.path).value, 'r')
-        
-        contents = file.read()
-
-        file.close()
-
-        ast = Parser(Lexer(contents).lex()).parse()
-        inter = Interpreter(ast)
-        inter.evaluate()
-
-        self.current_env.diffimport(inter.current_env)
+        module_env = self.modules.load(self.visitExpression(node.path))
+        self.current_env.diffimport(module_env)
+
+    def parseModule(self, path: str):
+        ast = Cache.load(path, Cache.Kind.AST)
+        if self.optimize:
+            # Imported here, the optimizer folds with the operators above
+            from Optimizer import Optimizer
+            ast = Optimizer().optimize(ast)
+
+        resolver = Resolver(self.globals.keys())
+        size = resolver.resolve(ast)
+        return ast, size, resolver.names
+
+    def runModule(self, path: str):
+        key = self.modules.key(path)
+        if key not in self.parsed:
+            self.parsed[key] = self.parseModule(path)
+        ast, size, names = self.parsed[key]
+
+        # Modules run on this interpreter in a scope of their own, so the
+        # functions they export close over it like any other function
+        module_env = Environment(self, None, self.globals, size=size, names=names)
+        last_env = self.current_env
+        self.current_env = module_env
+
+        try:
+            self.visitBlock(ast)
+        finally:
+            self.current_env = last_env
+
+        return module_env
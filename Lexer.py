@@ -1,5 +1,6 @@
 from enum import Enum
 from dataclasses import dataclass
+import re
 
 from Error import *
 
@@ -9,7 +10,7 @@ LETTERS = 'abcdefghijklmnopqrstuvwxyz' + 'abcdefghijklmnopqrstuvwxyz'.upper() +
 IDENTIFIER_LETTERS = LETTERS + NUMBERS
 STRING = IDENTIFIER_LETTERS + SYMBOLS
 
-KEYWORDS = ['and', 'or', 'return', 'if', 'else', 'while', 'for', 'in', 'break', 'import']
+KEYWORDS = ['and', 'or', 'return', 'if', 'else', 'while', 'for', 'in', 'break', 'import', 'continue']
 BOOL_VAL = ['true', 'false']
 NULL_VAL = 'null'
 
@@ -61,214 +62,233 @@ class TokenType(Enum):
 
     LENGTHOP = 31
 
-@dataclass
+# Tokens compare by identity, the parser tests them against None all the time
+@dataclass(slots=True, eq=False)
 class Token:
     type: TokenType
     value: any = 0
     optional: any = 0
+    line: int = 0
+    column: int = 0
+
+# Tokens are sliced out of the source with one master pattern, each group
+# names what it matched and any spaces in front of a token are matched along
+# with it. A string is matched up to its closing quote, escapes and
+# interpolations included, and only strings using them are scanned again.
+STRING_CHARACTERS = re.escape(STRING.replace('\\', '').replace('{', ''))
+
+TOKEN_PATTERN = re.compile(r'''
+    [ \t\b]*
+    (?:
+        (?P<SYMBOL>==|!=|>=|<=|[.,\#\[\]+\-*^(){}=!><])
+      | (?P<NAME>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<NEWLINE>\n)
+      | (?P<NUMBER>[0-9][0-9.]*)
+      | (?P<STRING>"(?P<BODY>(?:[%s]+|\\[\s\S]|\{[^{}]*(?:[{}]|\Z))*)(?P<QUOTE>"?))
+      | (?P<COMMENT>//[^\n]*)
+      | (?P<BLOCKCOMMENT>/\*[\s\S]*?(?:/\*|\Z))
+      | (?P<DIVIDE>/)
+      | (?P<END>\Z)
+      | (?P<ERROR>[\s\S])
+    )
+''' % STRING_CHARACTERS, re.VERBOSE)
+
+# The parts of a string that has escapes or interpolations
+STRING_PARTS = re.compile(r'\\([\s\S])|\{([^{}]*)(?:[{}]|\Z)|([^\\{]+)')
+
+SYMBOL_TOKENS = {
+    '.': TokenType.DOT,
+    ',': TokenType.COMMA,
+    '#': TokenType.LENGTHOP,
+    '[': TokenType.LSBRACKET,
+    ']': TokenType.RSBRACKET,
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.MULTIPLY,
+    '^': TokenType.POWER,
+    '/': TokenType.DIVIDE,
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+    '{': TokenType.LBRACKET,
+    '}': TokenType.RBRACKET,
+    '==': TokenType.EEQ,
+    '=': TokenType.EQ,
+    '!=': TokenType.NQ,
+    '!': TokenType.NEG,
+    '>=': TokenType.GTE,
+    '>': TokenType.GT,
+    '<=': TokenType.LTE,
+    '<': TokenType.LT
+}
+
+NAME_TOKENS = {NULL_VAL: (TokenType.NULL, 0), BOOL_VAL[0]: (TokenType.BOOL, True), BOOL_VAL[1]: (TokenType.BOOL, False)}
+for keyword in KEYWORDS:
+    NAME_TOKENS[keyword] = (TokenType.KEYWORD, keyword)
+
+# Files are read in chunks of this many characters
+CHUNK_SIZE = 1 << 16
 
 class Lexer:
     def __init__(self, content) -> None:
-        self.text = content
-        self.currentNum = 0
+        # content is either the source text or an open file to read it from
+        if isinstance(content, str):
+            self.text = content
+            self.file = None
+        else:
+            self.text = ''
+            self.file = content
 
-        self.currentChar = self.text[self.currentNum] if self.currentNum < len(self.text) else None
         self.line = 1
-    
-    def advance(self):
-        self.currentNum += 1
-        self.currentChar = self.text[self.currentNum] if self.currentNum < len(self.text) else None
-    
-    def checkNext(self, char: str, get: bool = False):
-        baseRet =  (self.text[self.currentNum + 1] if self.currentNum + 1 < len(self.text) else 'NULL')
+        self.lineStart = 0
+        self.resume = None
 
-        if self.currentNum + 1 < len(self.text) and self.text[self.currentNum + 1] == char:
-            return True if not get else self.text[self.currentNum + 1]
-        return False if not get else baseRet
-    
     def lex(self):
+        return list(self.stream())
+
+    def stream(self):
+        # Yields tokens as they are found. Text read from a file is scanned a
+        # whole line at a time and dropped once its tokens have been yielded,
+        # a string or comment running past the read text waits for more of it
+        pos = 0
+
+        while True:
+            if self.file == None:
+                yield from self.scan(pos, len(self.text))
+                return
+
+            end = self.text.rfind('\n', pos) + 1
+            if end > pos:
+                yield from self.scan(pos, end, True)
+                pos = self.resume
+
+            self.text = self.text[pos:]
+            self.lineStart -= pos
+            pos = 0
+
+            chunk = self.file.read(CHUNK_SIZE)
+            if not chunk:
+                self.file = None
+            self.text += chunk
+
+    def newlines(self, start: int, end: int):
+        # Moves the line counter past every newline in text[start:end] and
+        # returns a NEWLINE token for each one
         tokens = []
+        pos = self.text.find('\n', start, end)
+
+        while pos != -1:
+            tokens.append(Token(TokenType.NEWLINE, 0, 0, self.line, pos - self.lineStart + 1))
+
+            self.line += 1
+            self.lineStart = pos + 1
+            pos = self.text.find('\n', pos + 1, end)
 
-        while self.currentChar != None:
-            if self.currentChar in ' \t\b':
-                self.advance()
-            elif self.currentChar == '\n':
-                self.line += 1
-
-                tokens.append(Token(TokenType.NEWLINE))
-                self.advance()
-            elif self.currentChar == '.':
-                tokens.append(Token(TokenType.DOT))
-                self.advance()
-            elif self.currentChar == ',':
-                tokens.append(Token(TokenType.COMMA))
-                self.advance()
-            elif self.currentChar == '#':
-                tokens.append(Token(TokenType.LENGTHOP))
-                self.advance()
-            elif self.currentChar == '[':
-                tokens.append(Token(TokenType.LSBRACKET))
-                self.advance()
-            elif self.currentChar == ']':
-                tokens.append(Token(TokenType.RSBRACKET))
-                self.advance()
-            elif self.currentChar == '+':
-                tokens.append(Token(TokenType.PLUS))
-                self.advance()
-            elif self.currentChar == '-':
-                tokens.append(Token(TokenType.MINUS))
-                self.advance()
-            elif self.currentChar == '*':
-                tokens.append(Token(TokenType.MULTIPLY))
-                self.advance()
-            elif self.currentChar == '^':
-                tokens.append(Token(TokenType.POWER))
-                self.advance()
-            elif self.currentChar == '/':
-                if self.checkNext('/'):
-                    while self.currentChar != None and self.currentChar != '\n':
-                        self.advance()
-                elif self.checkNext('*'):
-                    while self.currentChar != None:
-                        self.advance()
-                        if self.currentChar == '\n':
-                            tokens.append(Token(TokenType.NEWLINE))
-                        if self.currentChar == '/' and self.checkNext('*'):
-                            self.advance()
-                            self.advance()
-                            break
-                else:
-                    tokens.append(Token(TokenType.DIVIDE))
-                    self.advance()    
-            elif self.currentChar == '(':
-                tokens.append(Token(TokenType.LPAREN))
-                self.advance()
-            elif self.currentChar == ')':
-                tokens.append(Token(TokenType.RPAREN))
-                self.advance()
-            elif self.currentChar == '{':
-                tokens.append(Token(TokenType.LBRACKET))
-                self.advance()
-            elif self.currentChar == '}':
-                tokens.append(Token(TokenType.RBRACKET))
-                self.advance()
-            elif self.currentChar == '=':
-                if self.checkNext('='):
-                    tokens.append(Token(TokenType.EEQ, 0))
-                    self.advance()
-                    self.advance()
-                else:
-                    tokens.append(Token(TokenType.EQ, 0))
-                    self.advance()
-            elif self.currentChar == '!':
-                if self.checkNext('='):
-                    tokens.append(Token(TokenType.NQ, 0))
-                    self.advance()
-                    self.advance()
-                else:
-                    tokens.append(Token(TokenType.NEG, 0))
-                    self.advance()
-            elif self.currentChar == '>':
-                if self.checkNext('='):
-                    tokens.append(Token(TokenType.GTE, 0))
-                    self.advance()
-                    self.advance()
-                else:
-                    tokens.append(Token(TokenType.GT, 0))
-                    self.advance()
-            elif self.currentChar == '<':
-                if self.checkNext('='):
-                    tokens.append(Token(TokenType.LTE, 0))
-                    self.advance()
-                    self.advance()
-                else:
-                    tokens.append(Token(TokenType.LT, 0))
-                    self.advance()
-            elif self.currentChar == '"':
-                self.advance()
-                tokens.append(self.lex_string())
-                if self.currentChar != '"':
-                    InvalidCharacterError(self.currentChar, self.line)
-                self.advance()
-            elif self.currentChar in NUMBERS:
-                tokens.append(Token(TokenType.NUMBER, self.lex_number()))
-            elif self.currentChar in LETTERS:
-                tokens.append(self.lex_id())
-            else:
-                InvalidCharacterError(self.currentChar, self.line)
-        
         return tokens
 
-    def lex_number(self):
-        nstr = ''
-        dotcount = 0
+    def tokenize(self, pos: int, end: int):
+        return list(self.scan(pos, end))
+
+    def scan(self, pos: int, end: int, partial: bool = False):
+        # Yields the tokens in text[pos:end]. When partial the text goes on
+        # after end, a string or block comment cut off there is left for the
+        # next scan and self.resume says where it starts
+        symbols = SYMBOL_TOKENS
+        names = NAME_TOKENS
+        IDENTIFIER = TokenType.IDENTIFIER
+        NEWLINE = TokenType.NEWLINE
+        if partial:
+            self.resume = end
+
+        # The line counter lives in locals here and is handed back to self
+        # around anything that can move it
+        line = self.line
+        lineStart = self.lineStart
+
+        for m in TOKEN_PATTERN.finditer(self.text, pos, end):
+            kind = m.lastgroup
+
+            if kind == 'SYMBOL':
+                yield Token(symbols[m.group(kind)], 0, 0, line, m.start(kind) - lineStart + 1)
+            elif kind == 'NAME':
+                name = m.group(kind)
+                type, value = names.get(name) or (IDENTIFIER, name)
+                yield Token(type, value, 0, line, m.start(kind) - lineStart + 1)
+            elif kind == 'NEWLINE':
+                yield Token(NEWLINE, 0, 0, line, m.start(kind) - lineStart + 1)
+                line += 1
+                lineStart = m.end()
+            elif kind == 'NUMBER':
+                self.line, self.lineStart = line, lineStart
+                yield self.lex_number(m.group(kind), m.start(kind))
+            elif kind == 'DIVIDE':
+                yield Token(TokenType.DIVIDE, 0, 0, line, m.start(kind) - lineStart + 1)
+            elif kind in ['STRING', 'BLOCKCOMMENT', 'ERROR']:
+                if partial and m.end() == end and self.unfinished(m, kind):
+                    self.resume = m.start(kind)
+                    break
+
+                self.line, self.lineStart = line, lineStart
+
+                if kind == 'STRING':
+                    yield self.lex_string(m, end)
+                elif kind == 'BLOCKCOMMENT':
+                    # Every line the comment spans still counts as a line
+                    yield from self.newlines(m.start(kind), m.end())
+                else:
+                    InvalidCharacterError(m.group(kind), line)
+
+                line, lineStart = self.line, self.lineStart
+
+        self.line, self.lineStart = line, lineStart
+
+    def unfinished(self, m, kind: str):
+        # Whether a string or block comment ran into the end of the scanned text
+        if kind == 'STRING':
+            return m.group('QUOTE') == ''
+        elif kind == 'BLOCKCOMMENT':
+            comment = m.group(kind)
+            return len(comment) < 4 or not comment.endswith('/*')
 
-        while self.currentChar != None and self.currentChar in NUMBERS + '.':
-            if self.currentChar == '.':
-                if dotcount == 1: InvalidCharacterError(self.currentChar, self.line)
-                dotcount += 1
-            
-            nstr += self.currentChar
-            self.advance()
-        
-        if nstr.endswith('.'): nstr = nstr[:-1]
+        return False
 
-        return float(nstr)
+    def lex_number(self, number: str, start: int):
+        column = start - self.lineStart + 1
 
-    def lex_string(self):
-        string = ''
+        if number.count('.') > 1:
+            InvalidCharacterError('.', self.line)
+        if number.endswith('.'):
+            number = number[:-1]
+
+        return Token(TokenType.NUMBER, float(number), 0, self.line, column)
+
+    def lex_string(self, m, end: int):
+        line, column = self.line, m.start('STRING') - self.lineStart + 1
+        body = m.group('BODY')
         modifiers = {}
-        is_f_string = False
-        
-        idx = 0
-        while self.currentChar != None and self.currentChar in STRING:
-            # Character Escaping
-            if self.currentChar == '\\':
-                self.advance()
-                if self.currentChar in 'n':
-                    string += '\n'
+
+        if '\\' in body or '{' in body:
+            pieces = []
+            idx = 0
+
+            for part in STRING_PARTS.finditer(self.text, m.start('BODY'), m.end('BODY')):
+                # Character Escaping
+                if part.group(1) != None:
+                    pieces.append('\n' if part.group(1) == 'n' else part.group(1))
+                    self.newlines(part.start(1), part.end(1))
+                    idx += 1
+
+                # Formatted Strings, the key is where the value goes in the string
+                elif part.group(2) != None:
+                    modifiers[str(idx)] = self.tokenize(part.start(2), part.end(2))
+                    idx += 1
                 else:
-                    string += self.currentChar
-                    
-                self.advance()
-
-                idx += 1; continue
-            
-            # Formatted Strings
-            if self.currentChar == '{':
-                self.advance()
-                inputstream = ''
-                while self.currentChar != None and not (self.currentChar in '{}'):
-                    inputstream += self.currentChar
-                    self.advance()
-
-                idx += 1
-                is_f_string = True
-                modifiers[str(idx - 1)] = Lexer(inputstream).lex()
-                self.advance()
-            else:
-                string += self.currentChar
-                idx += 1
-                self.advance()
-
-
-        type = TokenType.FSTRING if is_f_string else TokenType.STRING
-        return Token(type, string, modifiers)
-    
-    def lex_id(self):
-        identifier = ''
-        while self.currentChar != None and self.currentChar in IDENTIFIER_LETTERS:
-            identifier += self.currentChar
-            self.advance()
-        
-        if identifier == NULL_VAL:
-            return Token(TokenType.NULL, 0)
-        elif identifier in BOOL_VAL:
-            if identifier == BOOL_VAL[0]:
-                return Token(TokenType.BOOL, True)
-            else:
-                return Token(TokenType.BOOL, False)
-        elif identifier in KEYWORDS:
-            return Token(TokenType.KEYWORD, identifier)
-        else:
-            return Token(TokenType.IDENTIFIER, identifier)
+                    pieces.append(part.group(3))
+                    idx += len(part.group(3))
+
+            body = ''.join(pieces)
+
+        # Strings inside an interpolation end where the interpolation ends
+        if m.group('QUOTE') == '':
+            InvalidCharacterError(self.text[m.end()] if m.end() < end else None, self.line)
+
+        return Token(TokenType.FSTRING if len(modifiers) > 0 else TokenType.STRING, body, modifiers, line, column)
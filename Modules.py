@@ -0,0 +1,54 @@
+import os
+
+from Error import *
+
+# Every engine keeps one registry of the modules it has imported, keyed by the
+# real path of the file. A module runs the first time it is imported and every
+# later import reuses the environment it left behind.
+
+class ModuleRegistry:
+    def __init__(self, run):
+        # run(path) executes a module and returns its top level environment
+        self.run = run
+        self.modules = {}
+        self.loading = []
+        self.keys = {}
+
+    def key(self, path: str):
+        # Resolving a path goes to the file system, so each path is only
+        # resolved once from each working directory
+        where = (os.getcwd(), path)
+        if where not in self.keys:
+            self.keys[where] = os.path.realpath(path)
+        return self.keys[where]
+
+    def load(self, path: str, line: int = None):
+        key = self.key(path)
+
+        if key in self.modules:
+            return self.modules[key]
+
+        if key in self.loading:
+            cycle = self.loading[self.loading.index(key):] + [key]
+            ImportError([os.path.relpath(p) for p in cycle], line)
+
+        self.loading.append(key)
+        try:
+            env = self.run(path)
+        finally:
+            self.loading.pop()
+
+        self.modules[key] = env
+        return env
+
+    def invalidate(self, path: str = None):
+        # Forgets one module, or every module when no path is given, so the
+        # next import runs it again
+        if path == None:
+            self.modules.clear()
+        else:
+            self.modules.pop(self.key(path), None)
+
+    def reload(self, path: str):
+        self.invalidate(path)
+        return self.load(path)
@@ -0,0 +1,195 @@
+from Parser import *
+from Interpreter import unop, binop, compare, length, interpolate
+
+# An optional pass over the parsed program, run before the resolver. It folds
+# operators whose operands are all literals and drops branches and loops whose
+# condition is a known constant. Folding goes through the same operator helpers
+# as the engines, and anything that would raise is left for runtime so the
+# error still happens on its line.
+
+LITERALS = [NodeType.NumberNode, NodeType.StringNode, NodeType.BooleanNode, NodeType.NullNode]
+
+def count(node):
+    # Number of nodes in a tree, lists and dicts of nodes included
+    if isinstance(node, list):
+        return sum(count(item) for item in node)
+    if isinstance(node, dict):
+        return sum(count(key) + count(value) for key, value in node.items())
+    if not isinstance(node, Node):
+        return 0
+
+    return 1 + sum(count(getattr(node, name)) for name in attributes(type(node)))
+
+def attributes(cls):
+    # The slots of a node class and of the classes it derives from
+    return [name for base in cls.__mro__ for name in getattr(base, '__slots__', ())]
+
+class Optimizer:
+    def __init__(self):
+        self.eliminated = 0
+
+    def optimize(self, ast):
+        if not isinstance(ast, list):
+            return ast
+
+        before = count(ast)
+        ast = self.optimizeBlock(ast)
+        self.eliminated += before - count(ast)
+        return ast
+
+    def optimizeBlock(self, block: list):
+        result = []
+
+        for stmt in block:
+            stmt = self.optimizeStatement(stmt)
+            if stmt != None:
+                result.append(stmt)
+
+        return result
+
+    def optimizeStatement(self, statement: Node):
+        # Returns the statement to keep, or None to drop it
+        if statement.type == NodeType.VarNode:
+            statement.value = self.fold(statement.value)
+
+        elif statement.type == NodeType.DSONode:
+            statement.path = [self.fold(node) for node in statement.path]
+            statement.value = self.fold(statement.value)
+
+        elif statement.type == NodeType.ReturnNode:
+            statement.returnValue = self.fold(statement.returnValue)
+
+        elif statement.type == NodeType.ImportNode:
+            statement.path = self.fold(statement.path)
+
+        elif statement.type == NodeType.FunctionCallNode:
+            return self.fold(statement)
+        elif statement.type == NodeType.IfStatementNode:
+            return self.optimizeIfStatementNode(statement)
+        elif statement.type == NodeType.WhileLoopNode:
+            return self.optimizeWhileLoopNode(statement)
+        elif statement.type == NodeType.ForLoopNode:
+            return self.optimizeForLoopNode(statement)
+
+        return statement
+
+    def fold(self, expression: Node):
+        if expression.type in [NodeType.BinOpNode, NodeType.CondNode]:
+            expression.left = self.fold(expression.left)
+            expression.right = self.fold(expression.right)
+
+            if expression.left.type in LITERALS and expression.right.type in LITERALS:
+                operator = binop if expression.type == NodeType.BinOpNode else compare
+                return self.constant(expression, operator, expression.op, getValueFromNode(expression.left), getValueFromNode(expression.right))
+
+        elif expression.type == NodeType.UnOpNode:
+            expression.node = self.fold(expression.node)
+
+            if expression.node.type in LITERALS:
+                return self.constant(expression, unop, getValueFromNode(expression.node))
+
+        elif expression.type == NodeType.LengthOpNode:
+            expression.val = self.fold(expression.val)
+
+            # Array and object literals build a new value every time, strings don't
+            if expression.val.type in LITERALS:
+                return self.constant(expression, length, getValueFromNode(expression.val))
+
+        elif expression.type == NodeType.FormatNode:
+            expression.parts = [self.fold(part) for part in expression.parts]
+
+            if all(part.type in LITERALS for part in expression.parts):
+                return self.constant(expression, interpolate, [getValueFromNode(part) for part in expression.parts])
+
+        elif expression.type == NodeType.ArrayNode:
+            expression.value = [self.fold(value) for value in expression.value]
+        elif expression.type == NodeType.ObjectNode:
+            expression.value = {key: self.fold(value) for key, value in expression.value.items()}
+        elif expression.type == NodeType.IndexNode:
+            expression.path = [self.fold(node) for node in expression.path]
+        elif expression.type == NodeType.FunctionCallNode:
+            if isinstance(expression.name, Node):
+                expression.name = self.fold(expression.name)
+            expression.args = [self.fold(arg) for arg in expression.args]
+        elif expression.type == NodeType.FunctionNode:
+            expression.block = self.optimizeBlock(expression.block)
+
+        return expression
+
+    def constant(self, expression: Node, operator, *args):
+        try:
+            value = operator(*args)
+        except Exception:
+            return expression
+
+        nodeType = getNodeTypeFromValue(value)
+        if not nodeType in LITERALS:
+            return expression
+
+        return self.located(Node(nodeType, value), expression)
+
+    def located(self, node: Node, at: Node):
+        node.line = at.line
+        node.column = at.column
+        return node
+
+    def isConstant(self, condition: Node):
+        return condition.type in LITERALS
+
+    def optimizeIfStatementNode(self, node: IfStatementNode):
+        branches = []
+        els = node._else
+
+        for branch in [node] + node.elifs:
+            branch.condition = self.fold(branch.condition)
+            branch.body = self.optimizeBlock(branch.body)
+
+            if self.isConstant(branch.condition):
+                if not getValueFromNode(branch.condition):
+                    continue
+
+                # Always taken, so it is the else of whatever is left before it
+                els = branch
+                break
+
+            branches.append(branch)
+        else:
+            if els != None:
+                els.body = self.optimizeBlock(els.body)
+
+        if len(branches) == 0:
+            if els == None:
+                return None
+
+            # Kept as an if so variables in the body stay local to it
+            return self.located(IfStatementNode(Node(NodeType.BooleanNode, True), els.body, [], None), node)
+
+        return self.located(IfStatementNode(branches[0].condition, branches[0].body, branches[1:], els), branches[0])
+
+    def optimizeWhileLoopNode(self, node: WhileLoopNode):
+        node.condition = self.fold(node.condition)
+        if self.isConstant(node.condition) and not getValueFromNode(node.condition):
+            return None
+
+        node.body = self.optimizeBlock(node.body)
+        return node
+
+    def optimizeForLoopNode(self, node: ForLoopNode):
+        node.start = self.fold(node.start)
+        if node.end != None:
+            node.end = self.fold(node.end)
+            if node.step != None:
+                node.step = self.fold(node.step)
+
+            # Loops that start at or past their end never run, which way is
+            # past depends on the sign of the step
+            start, end, step = node.start, node.end, node.step
+            if start.type == NodeType.NumberNode and end.type == NodeType.NumberNode:
+                if step == None or (step.type == NodeType.NumberNode and step.value > 0):
+                    if start.value >= end.value:
+                        return None
+                elif step.type == NodeType.NumberNode and step.value < 0 and start.value <= end.value:
+                    return None
+
+        node.body = self.optimizeBlock(node.body)
+        return node
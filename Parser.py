@@ -1,11 +1,10 @@
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from collections import deque
 
 from Lexer import *
 
 class NodeType(Enum):
-    NewLineNode = -1
-
     NumberNode = 0
     BinOpNode = 1
     UnOpNode = 2
@@ -38,19 +37,12 @@ class NodeType(Enum):
     BreakNode = 23
 
     GlobalNode = 24
-    AttachNode = 25
+    ContinueNode = 25
 
     ImportNode = 26
     ClassNode = 27
 
-class Global(Enum):
-    Log = 0
-    Sleep = 1
-    Time = 2
-    Input = 3
-    Random = 4
-    ToNumber = 5
-    ToString = 6
+    FormatNode = 28
 
 def getNodeFromToken(type):
     if type == TokenType.NUMBER:
@@ -64,15 +56,70 @@ def getNodeFromToken(type):
     else:
         raise Exception(f'PARSER METHOD "getNodeFromToken": Unable to cast TokenType to NodeType "{type.name}"')
 
-@dataclass
+# Runtime values are plain Python objects: numbers are floats (ints for
+# lengths and indices), then str, bool, None for null, list for arrays and
+# dict for objects. Functions stay nodes.
+
+def getValueFromNode(node):
+    # The runtime value a literal node stands for
+    if node.type == NodeType.NullNode:
+        return None
+
+    return node.value
+
+def getNodeTypeFromValue(value):
+    # The node type a runtime value corresponds to, for error messages and folding
+    if value is None:
+        return NodeType.NullNode
+    elif type(value) is bool:
+        return NodeType.BooleanNode
+    elif type(value) in [float, int]:
+        return NodeType.NumberNode
+    elif type(value) is str:
+        return NodeType.StringNode
+    elif type(value) is list:
+        return NodeType.ArrayNode
+    elif type(value) is dict:
+        return NodeType.ObjectNode
+    elif isinstance(value, Node):
+        return value.type
+
+    # Python values EPL has no type for, like the complex result of a
+    # fractional power of a negative number
+    return None
+
+def plain(value):
+    # Null, functions and builtins count as 0 in arithmetic and when printed,
+    # the value they held when every value was a node
+    if value is None or isinstance(value, Node):
+        return 0
+
+    return value
+
+# Nodes are slotted, every subclass lists the attributes it adds in
+# __slots__ so no node carries an instance dict
+@dataclass(slots=True)
 class Node:
     type: NodeType
     value: any = 0
 
+    # Where the node starts in the source, set by the parser. Nodes made at
+    # runtime have no position.
+    line: int = field(default=None, compare=False, repr=False)
+    column: int = field(default=None, compare=False, repr=False)
+
     def __hash__(self):
-        return self.type.value
+        # Array/Object keys are value nodes, so hash them by type and value.
+        # Python already hashes 1 and 1.0 the same, which keeps numeric keys
+        # normalised. Nodes holding unhashable values fall back to their type.
+        try:
+            return hash((self.type, self.value))
+        except TypeError:
+            return hash(self.type)
 
 class BinOpNode(Node):
+    __slots__ = ('left', 'op', 'right')
+
     def __init__(self, left: Node, op: TokenType, right: Node):
         super().__init__(NodeType.BinOpNode, 0)
         self.left = left
@@ -80,11 +127,15 @@ class BinOpNode(Node):
         self.right = right
 
 class UnOpNode(Node):
+    __slots__ = ('node',)
+
     def __init__(self, node: Node):
         super().__init__(NodeType.UnOpNode, 0)
         self.node = node
 
 class CondNode(Node):
+    __slots__ = ('left', 'right', 'op')
+
     def __init__(self, left: Node, op: TokenType, right: Node):
         super().__init__(NodeType.CondNode, 0)
         self.left = left
@@ -92,23 +143,35 @@ class CondNode(Node):
         self.op = op
 
 class VarNode(Node):
+    __slots__ = ('name', 'depth', 'slot')
+
     def __init__(self, name: str, value: Node):
         super().__init__(NodeType.VarNode, 0)
         self.name = name
         self.value = value
+        self.depth = None
+        self.slot = None
 
 class VarGetNode(Node):
-    def __init__(self, name: str):
+    __slots__ = ('name', 'depth', 'slot')
+
+    def __init__(self, name: str, depth: int = None, slot: int = None):
         super().__init__(NodeType.VarGetNode, 0)
         self.name = name
+        self.depth = depth
+        self.slot = slot
 
 class IndexNode(Node):
+    __slots__ = ('name', 'path')
+
     def __init__(self, name: str, path: list):
         super().__init__(NodeType.IndexNode, 0)
         self.name = name
         self.path = path
 
 class DSONode(Node):
+    __slots__ = ('name', 'path')
+
     def __init__(self, name: str, path: list, val: Node):
         super().__init__(NodeType.DSONode, 0)
         self.name = name
@@ -116,27 +179,41 @@ class DSONode(Node):
         self.value = val
 
 class ArrayNode(Node):
-    def __init__(self, value: dict):
+    __slots__ = ()
+
+    def __init__(self, value: list):
         super().__init__(NodeType.ArrayNode, 0)
         self.value = value
 
 class ObjectNode(Node):
+    __slots__ = ()
+
     def __init__(self, value: dict):
         super().__init__(NodeType.ObjectNode, 0)
         self.value = value
 
 class ReturnNode(Node):
+    __slots__ = ('returnValue',)
+
     def __init__(self, returnValue: Node = Node(NodeType.NullNode, 0)):
         super().__init__(NodeType.ReturnNode, 0)
         self.returnValue = returnValue
 
 class FunctionNode(Node):
-    def __init__(self, args: list, block: list):
+    __slots__ = ('args', 'block', 'env', 'size', 'code', 'names')
+
+    def __init__(self, args: list, block: list, env: object = None, size: int = 0, code: object = None, names: list = []):
         super().__init__(NodeType.FunctionNode, 0)
         self.args = args
         self.block = block
+        self.env = env
+        self.size = size
+        self.code = code
+        self.names = names
 
 class FunctionCallNode(Node):
+    __slots__ = ('args', 'name', 'path')
+
     def __init__(self, args: list, name: str or FunctionNode, path: IndexNode = None):
         super().__init__(NodeType.FunctionCallNode, 0)
         self.args = args
@@ -144,60 +221,117 @@ class FunctionCallNode(Node):
         self.path = path
 
 class IfStatementNode(Node):
+    __slots__ = ('condition', 'body', 'elifs', '_else', 'slots')
+
     def __init__(self, condition: CondNode, body: list = [], elifs: list = [], _else: Node = None):
         super().__init__(NodeType.IfStatementNode, 0)
         self.condition = condition
         self.body = body
         self.elifs = elifs
         self._else = _else
+        self.slots = []
 
 class WhileLoopNode(Node):
+    __slots__ = ('condition', 'body', 'slots')
+
     def __init__(self, condition: CondNode, body: list = []):
         super().__init__(NodeType.WhileLoopNode, 0)
         self.condition = condition
         self.body = body
+        self.slots = []
 
 class LengthOpNode(Node):
+    __slots__ = ('val',)
+
     def __init__(self, val: Node):
         super().__init__(NodeType.LengthOpNode, 0)
         self.val = val
 
 class ForLoopNode(Node):
-    def __init__(self, body, identifier, start: Node = None, end: Node = None):
+    __slots__ = ('body', 'identifier', 'start', 'end', 'step', 'depth', 'slot', 'slots')
+
+    def __init__(self, body, identifier, start: Node = None, end: Node = None, step: Node = None):
         super().__init__(NodeType.ForLoopNode, 0)
         self.body = body
         self.identifier = identifier
         self.start = start
         self.end = end
+        self.step = step
+        self.depth = None
+        self.slot = None
+        self.slots = []
 
 class GlobalNode(Node):
-    def __init__(self, gType: Global):
-        super().__init__(NodeType.GlobalNode, 0)
-        self.gType = gType
+    # A builtin, function is called with the evaluated arguments and returns
+    # a runtime value. An arity of None takes any number of arguments.
+    __slots__ = ('name', 'function', 'arity')
 
-class AttachNode(Node):
-    def __init__(self, func):
-        super().__init__(NodeType.AttachNode, 0)
-        self.function = func
+    def __init__(self, name: str, function, arity: int = None):
+        super().__init__(NodeType.GlobalNode, 0)
+        self.name = name
+        self.function = function
+        self.arity = arity
 
 class ImportNode(Node):
+    __slots__ = ('path',)
+
     def __init__(self, path):
         super().__init__(NodeType.ImportNode, 0)
         self.path = path
 
+class FormatNode(Node):
+    __slots__ = ('parts',)
+
+    def __init__(self, parts: list):
+        super().__init__(NodeType.FormatNode, 0)
+        self.parts = parts
+
 class ClassNode(Node):
+    __slots__ = ('body',)
+
     def __init__(self, body: list):
         super().__init__(NodeType.ClassNode, 0)
         self.body = body
 
+# Binding power of the binary operators, higher binds tighter
+LOGIC_POWER = 1
+COMPARISON_POWER = 2
+
+LOGIC_OPERATORS = {KEYWORDS[0]: TokenType.AND, KEYWORDS[1]: TokenType.OR}
+
+OPERATOR_POWERS = {
+    TokenType.EEQ: COMPARISON_POWER,
+    TokenType.NQ: COMPARISON_POWER,
+    TokenType.LTE: COMPARISON_POWER,
+    TokenType.LT: COMPARISON_POWER,
+    TokenType.GT: COMPARISON_POWER,
+    TokenType.GTE: COMPARISON_POWER,
+    TokenType.PLUS: 3,
+    TokenType.MINUS: 3,
+    TokenType.MULTIPLY: 4,
+    TokenType.DIVIDE: 4,
+    TokenType.POWER: 5
+}
+
+# Operators that can be put in front of "=" in an assignment
+COMPOUND_OPERATORS = (TokenType.PLUS, TokenType.MINUS, TokenType.MULTIPLY, TokenType.DIVIDE, TokenType.POWER)
+
+LITERAL_TOKENS = (TokenType.NUMBER, TokenType.BOOL, TokenType.NULL, TokenType.STRING)
+# Postfix calls and indexing
+MODIFIER_TOKENS = (TokenType.LPAREN, TokenType.LSBRACKET, TokenType.DOT)
+
 class Parser:
     def __init__(self, tokens) -> None:
-        self.tokens = tokens
-        self.currentNum = 0
-        self.currentToken = self.tokens[0] if self.currentNum < len(self.tokens) else None
+        # tokens can be a list or a stream from Lexer.stream(), they are
+        # pulled one at a time with a single token of lookahead
+        self.tokens = iter(tokens)
+        self.lookahead = deque()
 
         self.current_line = 1
         self.ast = []
+
+        self.currentToken = None
+        self.advance()
     
     def check(self, tokenType: TokenType or list):
         while self.currentToken != None and self.currentToken.type == TokenType.NEWLINE:
@@ -232,30 +366,27 @@ class Parser:
         
         return True
     
-    def checkNext(self, tokenType: TokenType, next: int = 0):
-        idx = 1
-        cond1 = self.currentNum + idx < len(self.tokens)
-        try:
-            cond2 = self.tokens[self.currentNum + idx] == TokenType.NEWLINE
-        except:
-            cond2 = False
+    def next(self):
+        if self.lookahead:
+            return self.lookahead.popleft()
+        return next(self.tokens, None)
 
-        while cond1 and cond2:
-            idx += 1
-        
-        idx += next
+    def peek(self, idx: int = 1):
+        # The token idx places after the current one, without moving
+        while len(self.lookahead) < idx:
+            token = next(self.tokens, None)
+            if token == None:
+                return None
+            self.lookahead.append(token)
 
-        try:
-            cond1 = self.tokens[self.currentNum + idx] != None
-            cond2 = self.tokens[self.currentNum + idx].type == tokenType
-        except:
-            cond1 = False
-            cond2 = False
-
-        if cond1 and cond2:
-            return True
-        
-        return False
+        return self.lookahead[idx - 1]
+
+    def peekType(self, idx: int = 1):
+        token = self.peek(idx)
+        return token.type if token != None else None
+
+    def checkNext(self, tokenType: TokenType, next: int = 0):
+        return self.peekType(1 + next) == tokenType
     
     def fstring(self):
          # Formatting String Interpolation
@@ -263,7 +394,7 @@ class Parser:
             return Node(NodeType.StringNode, self.currentToken.value)
 
         fstr = self.currentToken.value
-        string = None
+        parts = []
         keys = []
         idx = 0
 
@@ -271,7 +402,7 @@ class Parser:
         for key in self.currentToken.optional.keys():
             keys.append(key)
 
-        # String Interpolation
+        # String Interpolation, literal pieces and expressions in order
         while idx < len(self.currentToken.optional):
             key = keys[idx]
             value = self.currentToken.optional[key]
@@ -282,33 +413,37 @@ class Parser:
             else:
                 tval = fstr[int(key) - idx : int(keys[idx + 1]) - idx - 1]
 
-            expr = Parser(value).expression()
-            cstring = string or Node(NodeType.StringNode, fstr[:int(key)])
-            string = BinOpNode(cstring, TokenType.PLUS, expr)
-            string = BinOpNode(string, TokenType.PLUS, Node(NodeType.StringNode, tval))
+            if idx == 0 and int(key) > 0:
+                parts.append(Node(NodeType.StringNode, fstr[:int(key)]))
+
+            parts.append(Parser(value).expression())
+
+            if len(tval) > 0:
+                parts.append(Node(NodeType.StringNode, tval))
 
             idx += 1
         
         self.advance()
-        return string
+        return FormatNode(parts)
     
     def advance(self):
         nl = TokenType.NEWLINE
-        self.currentNum += 1
-        if self.currentNum < len(self.tokens):
-            while self.currentNum < len(self.tokens) and self.tokens[self.currentNum].type == nl:
-                self.currentNum += 1
-                self.current_line += 1
-                self.ast.append(Node(NodeType.NewLineNode, 0))
-
-            self.currentToken = self.tokens[self.currentNum] if self.currentNum < len(self.tokens) else None
-        else:
-            self.currentToken = None
+        token = self.next()
+
+        while token != None and token.type == nl:
+            token = self.next()
+
+        self.currentToken = token
+        if token != None:
+            self.current_line = token.line
+
+    def located(self, node: Node, at):
+        # Gives node the position of at, a token or another node
+        node.line = at.line
+        node.column = at.column
+        return node
     
     def parse(self):
-        if self.currentToken == None:
-            return Node(NodeType.NullNode)
-
         self.block()
         return self.ast
 
@@ -316,71 +451,41 @@ class Parser:
         lst = []
 
         while self.currentToken != None and not self.bcheck(TokenType.RBRACKET):
+            token = self.currentToken
+            stmt = self.located(self.statement(), token)
+
             if ret == True:
-                lst.append(self.statement())
+                lst.append(stmt)
             else:
-                self.ast.append(self.statement())
+                self.ast.append(stmt)
         
         return lst
 
     def statement(self):
-        COMP = False
-        COMP_OP = None
-        compound_ops = [TokenType.PLUS, TokenType.MINUS, TokenType.MULTIPLY, TokenType.DIVIDE, TokenType.POWER]
+        # A statement is told apart by its first token and the one after it
+        if self.bcheck(TokenType.IDENTIFIER):
+            following = self.peekType()
+            token = self.currentToken
 
-        cond = self.checkNext(compound_ops[0]) or self.checkNext(compound_ops[1]) or self.checkNext(compound_ops[2])
-        cond2 = self.checkNext(compound_ops[3]) or self.checkNext(compound_ops[4])
+            if following == TokenType.EQ or following in COMPOUND_OPERATORS:
+                id = self.check(TokenType.IDENTIFIER)
 
-        if self.bcheck(TokenType.IDENTIFIER) and (self.checkNext(TokenType.EQ) or cond or cond2):
-            id = self.check(TokenType.IDENTIFIER)
-
-            # Compound Operators
-            if self.bcheck(compound_ops):
-                COMP = True
-                COMP_OP = self.currentToken.type
-                self.advance()
-
-            self.check(TokenType.EQ)
-            val = self.expression()
-
-            if COMP:
-                return VarNode(id, BinOpNode(VarGetNode(id), COMP_OP, val))
-            else:
-                return VarNode(id, val)
+                # Compound Operators
+                if following != TokenType.EQ:
+                    self.advance()
 
-        elif self.bcheck(TokenType.IDENTIFIER) and (self.checkNext(TokenType.LSBRACKET) or self.checkNext(TokenType.DOT)):
-            path = []
-            id = self.check(TokenType.IDENTIFIER)
-            while self.bcheck(TokenType.LSBRACKET) or self.bcheck(TokenType.DOT):
-                last_type = self.currentToken.type
-                self.advance()
+                self.check(TokenType.EQ)
+                val = self.expression()
 
-                if last_type == TokenType.DOT:
-                    path.append(Node(NodeType.StringNode, self.check(TokenType.IDENTIFIER)))
+                if following != TokenType.EQ:
+                    current = self.located(VarGetNode(id), token)
+                    return VarNode(id, self.located(BinOpNode(current, following, val), token))
                 else:
-                    path.append(self.expression())
-                    self.check(TokenType.RSBRACKET)
-
-            # Compound Operators
-            if self.bcheck(compound_ops):
-                COMP = True
-                COMP_OP = self.currentToken.type
-                self.advance()
-            
-            # Modifier
-            left = IndexNode(id, path)        
-            left = self.modifier(left)
-            if left.type == NodeType.FunctionCallNode:
-                return left
-
+                    return VarNode(id, val)
 
-            self.check(TokenType.EQ)
-            val = self.expression()
+            elif following in [TokenType.LSBRACKET, TokenType.DOT]:
+                return self.dsassignment()
 
-            if COMP:
-                return DSONode(id, path, BinOpNode(IndexNode(id, path), COMP_OP, val))
-            else:
-                return DSONode(id, path, val)
         elif self.bcheck(TokenType.KEYWORD):
             kw = self.check(TokenType.KEYWORD)
             if kw == KEYWORDS[2]:
@@ -401,83 +506,98 @@ class Parser:
             elif kw == KEYWORDS[8]:
                 # Break
                 return Node(NodeType.BreakNode)
+            elif kw == KEYWORDS[10]:
+                # Continue
+                return Node(NodeType.ContinueNode)
             elif kw == KEYWORDS[9]:
                 # Import
                 return ImportNode(self.expression())
-        else:
-            expr = self.expression()
 
-            if expr.type != NodeType.FunctionCallNode:
-                InvalidSyntaxError(expr, self.current_line, 'Expected Function call')
-            
-            return expr
+            InvalidSyntaxError(Token(TokenType.KEYWORD, kw), self.current_line, 'Expected a statement.')
 
-    def expression(self):
-        left = self.cexpr()
-        
-        andval = KEYWORDS[0]
-        orval = KEYWORDS[1]
+        expr = self.expression()
 
-        while self.currentToken != None and self.currentToken.type == TokenType.KEYWORD:
-            op = self.currentToken.value
+        if expr.type != NodeType.FunctionCallNode:
+            InvalidSyntaxError(expr, self.current_line, 'Expected Function call')
 
-            if op == andval:    op = TokenType.AND
-            elif op == orval:   op = TokenType.OR
-            else:               break
+        return expr
 
+    def dsassignment(self):
+        COMP_OP = None
+        path = []
+        token = self.currentToken
+        id = self.check(TokenType.IDENTIFIER)
+        while self.bcheck(TokenType.LSBRACKET) or self.bcheck(TokenType.DOT):
+            last_type = self.currentToken.type
             self.advance()
-            left = CondNode(left, op, self.cexpr())
 
-        return left
-
-    def cexpr(self):
-        left = self.expr()
-        valid =  [TokenType.EEQ, TokenType.NQ, TokenType.LTE, TokenType.LT, TokenType.GT, TokenType.GTE]
+            if last_type == TokenType.DOT:
+                path.append(Node(NodeType.StringNode, self.check(TokenType.IDENTIFIER)))
+            else:
+                path.append(self.expression())
+                self.check(TokenType.RSBRACKET)
 
-        while self.currentToken != None and self.currentToken.type in valid:
-            op = self.currentToken.type
+        # Compound Operators
+        if self.bcheck(COMPOUND_OPERATORS):
+            COMP_OP = self.currentToken.type
             self.advance()
-            left = CondNode(left, op, self.expr())
 
-        return left
+        # Modifier
+        left = self.located(IndexNode(id, path), token)
+        left = self.modifier(left)
+        if left.type == NodeType.FunctionCallNode:
+            return left
 
-    def expr(self):
-        left = self.term()
+        self.check(TokenType.EQ)
+        val = self.expression()
 
-        while self.currentToken != None and self.currentToken.type in [TokenType.PLUS, TokenType.MINUS] and not self.checkNext(TokenType.EQ):
-            op = self.currentToken.type
-            self.advance()
-            left = BinOpNode(left, op, self.term())
-        
+        if COMP_OP != None:
+            current = self.located(IndexNode(id, path), token)
+            return DSONode(id, path, self.located(BinOpNode(current, COMP_OP, val), token))
+        else:
+            return DSONode(id, path, val)
 
-        return left
+    def expression(self, power: int = 0):
+        # Precedence climbing, every operator binding tighter than power is
+        # taken into this expression. All operators are left associative.
+        left = self.modifier()
+        token = self.currentToken
 
-    def term(self):
-        left = self.factor()
+        while token != None:
+            if token.type == TokenType.KEYWORD:
+                op = LOGIC_OPERATORS.get(token.value)
+                if op == None:
+                    break
+                opPower = LOGIC_POWER
+            else:
+                op = token.type
+                opPower = OPERATOR_POWERS.get(op)
+                if opPower == None:
+                    break
 
-        while self.currentToken != None and self.currentToken.type in [TokenType.MULTIPLY, TokenType.DIVIDE] and not self.checkNext(TokenType.EQ):
-            op = self.currentToken.type
-            self.advance()
-            left = BinOpNode(left, op, self.factor())
-        
-        return left
-    
+                # "+=" and the like end the expression, they belong to the statement
+                if op in COMPOUND_OPERATORS and self.peekType() == TokenType.EQ:
+                    break
 
-    def factor(self):
-        left = self.modifier()
+            if opPower <= power:
+                break
 
-        while self.currentToken != None and self.bcheck(TokenType.POWER) and not self.checkNext(TokenType.EQ):
             self.advance()
-            left = BinOpNode(left, TokenType.POWER, self.modifier())
-        
+            right = self.expression(opPower)
+
+            if opPower <= COMPARISON_POWER:
+                left = self.located(CondNode(left, op, right), left)
+            else:
+                left = self.located(BinOpNode(left, op, right), left)
+
+            token = self.currentToken
+
         return left
 
     def modifier(self, left: any = None):
         left = left or self.atom()
 
-        modifierTokens = [TokenType.LPAREN, TokenType.LSBRACKET, TokenType.DOT]
-        
-        while self.currentToken != None and self.currentToken.type in modifierTokens:
+        while self.currentToken != None and self.currentToken.type in MODIFIER_TOKENS:
             tok = self.currentToken.type
 
             if tok == TokenType.LPAREN:
@@ -491,7 +611,7 @@ class Parser:
                     self.check(TokenType.COMMA)
                 
                 self.check(TokenType.RPAREN)
-                left = FunctionCallNode(arglist, left)
+                left = self.located(FunctionCallNode(arglist, left), left)
             else:
                 # Index
                 path = []
@@ -505,23 +625,29 @@ class Parser:
                         path.append(self.expression())
                         self.check(TokenType.RSBRACKET)
                 
-                left = IndexNode(left, path)
+                left = self.located(IndexNode(left, path), left)
 
         return left
     
     def atom(self):
+        # Operands are located at their first token
+        token = self.currentToken
+        return self.located(self.operand(), token)
+
+    def operand(self):
         if self.currentToken != None:
-            if self.currentToken.type == TokenType.FSTRING:
+            tt = self.currentToken.type
+
+            if tt == TokenType.FSTRING:
                 return self.fstring()
-            elif self.currentToken.type in [TokenType.NUMBER, TokenType.BOOL, TokenType.NULL, TokenType.STRING]:
-                type = self.currentToken.type
+            elif tt in LITERAL_TOKENS:
                 value = self.currentToken.value
                 self.advance()
-                return Node(getNodeFromToken(type), value)
-            elif self.currentToken.type == TokenType.LENGTHOP:
+                return Node(getNodeFromToken(tt), value)
+            elif tt == TokenType.LENGTHOP:
                 self.advance()
                 return LengthOpNode(self.atom())
-            elif self.currentToken.type == TokenType.LPAREN:
+            elif tt == TokenType.LPAREN:
                 # Functions or simple change of operations
                 arglist = []
                 body = []
@@ -561,34 +687,32 @@ class Parser:
                     body = self.block(True)
                     self.check(TokenType.RBRACKET)
                 else:
-                    body = [ReturnNode(self.expression())]
+                    token = self.currentToken
+                    body = [self.located(ReturnNode(self.expression()), token)]
                 
 
                 return FunctionNode(arglist, body)
     
-            elif self.currentToken.type in [TokenType.MINUS, TokenType.NEG]:
+            elif tt == TokenType.MINUS or tt == TokenType.NEG:
                 self.advance()
                 return UnOpNode(self.atom())
-            elif self.currentToken.type == TokenType.IDENTIFIER:
-                path = []
-                
+            elif tt == TokenType.IDENTIFIER:
                 id = self.currentToken.value
                 self.advance()
 
                 return VarGetNode(id)
 
-            elif self.currentToken.type == TokenType.LSBRACKET:
+            elif tt == TokenType.LSBRACKET:
                 return self.datastructure()
             else:
                 InvalidSyntaxError(self.currentToken, self.current_line, 'Expected Literal.')
         else:
-            InvalidSyntaxError(self.currentToken, self.current_line, 'Expected Literal, got null.')
+            InvalidSyntaxError(Token(TokenType.NULL), self.current_line, 'Expected Literal, got null.')
 
     def datastructure(self):
         self.check(TokenType.LSBRACKET)
         
         valueList = {}
-        idx = 0
 
         if self.bcheck(TokenType.IDENTIFIER) and self.checkNext(TokenType.EQ):
             while not self.bcheck(TokenType.RSBRACKET):
@@ -599,9 +723,9 @@ class Parser:
             self.check(TokenType.RSBRACKET)
             return ObjectNode(valueList)
         else:
+            valueList = []
             while not self.bcheck(TokenType.RSBRACKET):
-                valueList[Node(NodeType.NumberNode, idx)] = self.expression()
-                idx += 1
+                valueList.append(self.expression())
 
                 if not (self.currentToken.type == TokenType.COMMA):
                     break
@@ -627,13 +751,16 @@ class Parser:
             return IfStatementNode(condition, body)
 
         while self.bcheck(TokenType.KEYWORD) and self.currentToken.value == ELSEKW:
+            token = self.currentToken
             self.advance()
             if self.bcheck(TokenType.KEYWORD) and self.currentToken.value == IFKW:
+                token = self.currentToken
                 self.advance()
-                elifs.append(self.ifstatement(False))
+                elifs.append(self.located(self.ifstatement(False), token))
             else:
                 self.check(TokenType.LBRACKET)
                 els = IfStatementNode(CondNode(Node(NodeType.NullNode), TokenType.EEQ, Node(NodeType.NullNode)), self.block(True))
+                self.located(els, token)
                 self.check(TokenType.RBRACKET)
                 break
         
@@ -665,7 +792,14 @@ class Parser:
         else:
             self.advance()
             expr2 = self.expression()
+
+            # An optional step after the end
+            expr3 = None
+            if self.bcheck(TokenType.COMMA):
+                self.advance()
+                expr3 = self.expression()
+
             self.check(TokenType.LBRACKET)
             body = self.block(True)
             self.check(TokenType.RBRACKET)
-            return ForLoopNode(body, id, expr1, expr2)
+            return ForLoopNode(body, id, expr1, expr2, expr3)
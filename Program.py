@@ -0,0 +1,28 @@
+import Cache
+from Resolver import Resolver
+from Optimizer import Optimizer
+from Builtins import BUILTINS
+
+# The embedding entry point. A host compiles a script once and hands the
+# Program to Interpreter.run as often as it likes, the Program itself is never
+# changed by running it.
+
+class Program:
+    def __init__(self, ast: list, size: int, names: list = []):
+        # A parsed and resolved script, size is the number of slots its top
+        # level frame needs and names the name of each
+        self.ast = ast
+        self.size = size
+        self.names = names
+
+def compile(source: str, names: list = [], optimize: bool = False, builtins: dict = BUILTINS):
+    # names are the variables the host will inject, so functions in the script
+    # that assign to them update the input instead of a local of their own
+    ast = Cache.parse(source)
+
+    if optimize:
+        ast = Optimizer().optimize(ast)
+
+    resolver = Resolver(list(builtins.keys()) + list(names))
+    size = resolver.resolve(ast)
+    return Program(ast, size, resolver.names)
@@ -0,0 +1,225 @@
+from Parser import *
+
+# The resolver runs between parsing and interpreting and gives every variable
+# an address. Locals live in the slots of their function's frame, found by
+# (depth, slot) where depth is how many closures out the frame is. Blocks do
+# not get frames of their own, their variables get extra slots in the frame of
+# the enclosing function and are only visible to the resolver while inside the
+# block. Globals keep depth None and are looked up by name, since imports can
+# add new ones at runtime.
+
+class FunctionScope:
+    def __init__(self, parent = None):
+        self.parent = parent
+        self.blocks = []
+        self.size = 0
+        # How many loops around the code being resolved, break and continue
+        # only work inside one of the same function
+        self.loops = 0
+        # The name of every slot, slots are never shared between names
+        self.names = []
+
+    def declare(self, name):
+        slot = self.size
+        self.size += 1
+        self.blocks[-1][name] = slot
+        self.names.append(name)
+        return slot
+
+    def find(self, name):
+        for block in reversed(self.blocks):
+            if name in block:
+                return block[name]
+        return None
+
+class Resolver:
+    def __init__(self, globals: list = []):
+        self.globals = set(globals)
+        self.function = None
+        self.names = []
+
+    def resolve(self, ast):
+        # Returns the number of slots the top level frame needs, names is left
+        # holding the name of each of them
+        self.function = FunctionScope()
+        self.function.blocks.append({})
+        self.names = self.function.names
+
+        if not isinstance(ast, list):
+            return 0
+
+        # Everything assigned at the top level is a global, even before its
+        # assignment runs, so functions defined earlier can update it
+        for stmt in ast:
+            if stmt.type == NodeType.VarNode:
+                self.globals.add(stmt.name)
+
+        for stmt in ast:
+            self.resolveStatement(stmt)
+
+        return self.function.size
+
+    def lookup(self, name):
+        depth = 0
+        function = self.function
+
+        while function != None:
+            slot = function.find(name)
+            if slot != None:
+                return depth, slot
+
+            function = function.parent
+            depth += 1
+
+        return None, None
+
+    def resolveGet(self, node):
+        node.depth, node.slot = self.lookup(node.name)
+
+    def resolveSet(self, node, name):
+        depth, slot = self.lookup(name)
+
+        if depth == None and not (name in self.globals):
+            if self.function.parent == None and len(self.function.blocks) == 1:
+                self.globals.add(name)
+            else:
+                depth, slot = 0, self.function.declare(name)
+
+        node.depth = depth
+        node.slot = slot
+
+    def resolveBlock(self, block):
+        # Returns the slots declared by this block so the interpreter can clear
+        # them whenever the block is entered again
+        self.function.blocks.append({})
+
+        # Names assigned in the block are visible to the whole block, which keeps
+        # reads ahead of the assignment working on later loop iterations
+        for stmt in block:
+            if stmt.type == NodeType.VarNode and self.lookup(stmt.name)[0] == None and not (stmt.name in self.globals):
+                self.function.declare(stmt.name)
+
+        for stmt in block:
+            self.resolveStatement(stmt)
+
+        return list(self.function.blocks.pop().values())
+
+    def resolveStatement(self, statement: Node):
+        if statement.type == NodeType.VarNode:
+            self.resolveExpression(statement.value)
+            self.resolveSet(statement, statement.name)
+
+        elif statement.type == NodeType.DSONode:
+            statement.name = self.resolveName(statement.name)
+            self.resolvePath(statement.path)
+            self.resolveExpression(statement.value)
+
+        elif statement.type == NodeType.ReturnNode:
+            self.resolveExpression(statement.returnValue)
+
+        elif statement.type == NodeType.BreakNode:
+            if self.function.loops == 0:
+                InvalidSyntaxError(Token(TokenType.KEYWORD, KEYWORDS[8]), statement.line, 'Break outside of a loop.')
+        elif statement.type == NodeType.ContinueNode:
+            if self.function.loops == 0:
+                InvalidSyntaxError(Token(TokenType.KEYWORD, KEYWORDS[10]), statement.line, 'Continue outside of a loop.')
+
+        elif statement.type == NodeType.ImportNode:
+            self.resolveExpression(statement.path)
+
+        elif statement.type == NodeType.FunctionCallNode:
+            self.resolveExpression(statement)
+        elif statement.type == NodeType.IfStatementNode:
+            self.resolveIfStatementNode(statement)
+        elif statement.type == NodeType.WhileLoopNode:
+            self.resolveWhileLoopNode(statement)
+        elif statement.type == NodeType.ForLoopNode:
+            self.resolveForLoopNode(statement)
+
+    def resolveExpression(self, expression: Node):
+        if expression.type == NodeType.VarGetNode:
+            self.resolveGet(expression)
+        elif expression.type in [NodeType.BinOpNode, NodeType.CondNode]:
+            self.resolveExpression(expression.left)
+            self.resolveExpression(expression.right)
+        elif expression.type == NodeType.UnOpNode:
+            self.resolveExpression(expression.node)
+        elif expression.type == NodeType.LengthOpNode:
+            self.resolveExpression(expression.val)
+        elif expression.type == NodeType.ArrayNode:
+            for value in expression.value:
+                self.resolveExpression(value)
+        elif expression.type == NodeType.FormatNode:
+            for part in expression.parts:
+                self.resolveExpression(part)
+        elif expression.type == NodeType.ObjectNode:
+            for value in expression.value.values():
+                self.resolveExpression(value)
+        elif expression.type == NodeType.IndexNode:
+            expression.name = self.resolveName(expression.name)
+            self.resolvePath(expression.path)
+        elif expression.type == NodeType.FunctionCallNode:
+            self.resolveExpression(expression.name)
+            for arg in expression.args:
+                self.resolveExpression(arg)
+        elif expression.type == NodeType.FunctionNode:
+            self.resolveFunctionNode(expression)
+
+    def resolveName(self, name):
+        # Index and DSO nodes name their variable with a plain string
+        if not isinstance(name, Node):
+            name = VarGetNode(name)
+
+        self.resolveExpression(name)
+        return name
+
+    def resolvePath(self, path: list):
+        for node in path:
+            self.resolveExpression(node)
+
+    def resolveFunctionNode(self, node: FunctionNode):
+        self.function = FunctionScope(self.function)
+        self.function.blocks.append({})
+
+        # Parameters take the first slots, in order
+        for arg in node.args:
+            self.function.declare(arg.value)
+
+        self.resolveBlock(node.block)
+
+        node.size = self.function.size
+        node.names = self.function.names
+        self.function = self.function.parent
+
+    def resolveIfStatementNode(self, node: IfStatementNode):
+        self.resolveExpression(node.condition)
+        node.slots = self.resolveBlock(node.body)
+
+        for elf in node.elifs:
+            self.resolveIfStatementNode(elf)
+
+        if node._else != None:
+            self.resolveIfStatementNode(node._else)
+
+    def resolveWhileLoopNode(self, node: WhileLoopNode):
+        self.resolveExpression(node.condition)
+
+        self.function.loops += 1
+        node.slots = self.resolveBlock(node.body)
+        self.function.loops -= 1
+
+    def resolveForLoopNode(self, node: ForLoopNode):
+        self.resolveExpression(node.start)
+        if node.end != None:
+            self.resolveExpression(node.end)
+        if node.step != None:
+            self.resolveExpression(node.step)
+
+        # The loop variable gets a block of its own around the body
+        self.function.blocks.append({})
+
+        self.resolveSet(node, node.identifier)
+
+        self.function.loops += 1
+        node.slots = self.resolveBlock(node.body) + list(self.function.blocks.pop().values())
+        self.function.loops -= 1
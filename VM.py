@@ -0,0 +1,419 @@
+from Lexer import TokenType
+from Parser import NodeType, FunctionNode, GlobalNode, getNodeTypeFromValue
+from Compiler import OpCode, Code, Compiler
+from Interpreter import Environment, EMPTY, WAITING_BUILTIN, unop, binop, compare, length, interpolate, counted
+from Builtins import BUILTINS
+import Cache
+from Modules import ModuleRegistry
+from Optimizer import Optimizer
+
+from types import CoroutineType
+import asyncio
+
+from Error import *
+
+LOAD_CONST = OpCode.LOAD_CONST.value
+LOAD_LOCAL = OpCode.LOAD_LOCAL.value
+STORE_LOCAL = OpCode.STORE_LOCAL.value
+LOAD_DEREF = OpCode.LOAD_DEREF.value
+STORE_DEREF = OpCode.STORE_DEREF.value
+LOAD_GLOBAL = OpCode.LOAD_GLOBAL.value
+STORE_GLOBAL = OpCode.STORE_GLOBAL.value
+POP = OpCode.POP.value
+BINARY = OpCode.BINARY.value
+COMPARE = OpCode.COMPARE.value
+NEGATE = OpCode.NEGATE.value
+LENGTH = OpCode.LENGTH.value
+BUILD_ARRAY = OpCode.BUILD_ARRAY.value
+BUILD_OBJECT = OpCode.BUILD_OBJECT.value
+INDEX = OpCode.INDEX.value
+STORE_INDEX = OpCode.STORE_INDEX.value
+JUMP = OpCode.JUMP.value
+JUMP_IF_FALSE = OpCode.JUMP_IF_FALSE.value
+MAKE_FUNCTION = OpCode.MAKE_FUNCTION.value
+CALL = OpCode.CALL.value
+RETURN = OpCode.RETURN.value
+CLEAR = OpCode.CLEAR.value
+ITER_RANGE = OpCode.ITER_RANGE.value
+ITER_DS = OpCode.ITER_DS.value
+FOR_ITER = OpCode.FOR_ITER.value
+IMPORT = OpCode.IMPORT.value
+FORMAT = OpCode.FORMAT.value
+INDEX_PATH = OpCode.INDEX_PATH.value
+
+FLOAT = float
+
+# What VM.steps yields when its budget runs out, and the budget it starts with
+# when nobody asked for one
+PAUSED = object()
+UNLIMITED = float('inf')
+
+PLUS = TokenType.PLUS.value
+MINUS = TokenType.MINUS.value
+MULTIPLY = TokenType.MULTIPLY.value
+
+LT = TokenType.LT.value
+LTE = TokenType.LTE.value
+GT = TokenType.GT.value
+GTE = TokenType.GTE.value
+
+class VM:
+    def __init__(self, builtins: dict = BUILTINS):
+        self.SELF = None
+        self.globals = dict(builtins)
+        self.modules = ModuleRegistry(self.runModule)
+        self.optimize = False
+
+    def compile(self, ast):
+        return Compiler(self.globals.keys()).compile(ast)
+
+    def load(self, path: str):
+        # Compiled code for a source file, from the .gof cache when it is fresh.
+        # Only unoptimised code is cached, optimising starts from the cached AST
+        if self.optimize:
+            return self.compile(Optimizer().optimize(Cache.load(path, Cache.Kind.AST)))
+
+        return Cache.load(path, Cache.Kind.CODE, lambda contents: self.compile(Cache.parse(contents)))
+
+    def run(self, code: Code):
+        # Runs a compiled file and returns its top level environment
+        env = Environment(self, None, self.globals, size=code.size, names=code.names)
+        self.root_env = env
+        self.execute(code, env)
+
+        return env
+
+    async def runAsync(self, code: Code, budget: int = None):
+        # Runs a compiled file as a coroutine. Builtins that wait, like the
+        # ones from Builtins.asynchronous, hand their coroutine out here to be
+        # awaited, so other tasks on the event loop run in the meantime. With
+        # a budget the script also gives way every budget instructions. Each
+        # script running at the same time needs a VM of its own.
+        env = Environment(self, None, self.globals, size=code.size, names=code.names)
+        self.root_env = env
+        steps = self.steps(code, env, UNLIMITED if budget == None else budget)
+        value = None
+
+        try:
+            while True:
+                try:
+                    waiting = steps.send(value)
+                except StopIteration:
+                    return env
+
+                if waiting is PAUSED:
+                    await asyncio.sleep(0)
+                    value = budget
+                else:
+                    value = await waiting
+        finally:
+            steps.close()
+
+    def start(self, code: Code):
+        # A compiled file ready to be run a slice at a time with Task.resume
+        env = Environment(self, None, self.globals, size=code.size, names=code.names)
+        self.root_env = env
+
+        return Task(self, code, env)
+
+    def runModule(self, path: str):
+        code = self.load(path)
+
+        module_env = Environment(self, None, self.globals, size=code.size, names=code.names)
+        self.execute(code, module_env)
+
+        return module_env
+
+    def iterDS(self, dstruct):
+        if not (type(dstruct) in [dict, list]):
+            TypeError(getNodeTypeFromValue(dstruct), NodeType.ArrayNode)
+
+        items = enumerate(dstruct) if type(dstruct) is list else dstruct.items()
+
+        for key, value in items:
+            yield {'key': key, 'value': value}
+
+    def execute(self, code: Code, env: Environment):
+        # Runs code to the end, only builtins that never wait can be called
+        steps = self.steps(code, env)
+        try:
+            waiting = next(steps)
+        except StopIteration as done:
+            return done.value
+
+        steps.close()
+        waiting.close()
+        raise Exception(WAITING_BUILTIN)
+
+    def steps(self, code: Code, env: Environment, budget = UNLIMITED):
+        # The interpreter loop, as a generator that yields the coroutine of a
+        # builtin that has to wait and is sent back its result. Calls between
+        # EPL functions push onto frames instead of recursing in Python, each
+        # frame remembers where its values start on the stack. Tail calls
+        # reuse the frame of the caller.
+        #
+        # budget is the number of instructions to run before yielding PAUSED
+        # and being sent the next budget. Instructions are only counted when
+        # control jumps, mark is where the current straight run started, and
+        # the budget is only checked at jumps and calls since every loop and
+        # recursion goes through one.
+        frames = []
+        stack = []
+        push = stack.append
+        pop = stack.pop
+
+        instructions = code.instructions
+        consts = code.consts
+        slots = env.slots
+        base = 0
+        pc = 0
+        mark = 0
+
+        try:
+            while True:
+                op, arg = instructions[pc]
+                pc += 1
+
+                if op == LOAD_LOCAL:
+                    value = slots[arg]
+                    if value is EMPTY:
+                        value = env.borrow(arg)
+                    push(value)
+                elif op == LOAD_CONST:
+                    push(consts[arg])
+                elif op == STORE_LOCAL:
+                    slots[arg] = pop()
+                elif op == BINARY:
+                    right = pop()
+                    left = pop()
+
+                    if type(left) is FLOAT and type(right) is FLOAT:
+                        if arg == PLUS:
+                            push(left + right)
+                            continue
+                        elif arg == MINUS:
+                            push(left - right)
+                            continue
+                        elif arg == MULTIPLY:
+                            push(left * right)
+                            continue
+
+                    push(binop(TokenType(arg), left, right))
+                elif op == COMPARE:
+                    right = pop()
+                    left = pop()
+
+                    if type(left) is FLOAT and type(right) is FLOAT:
+                        if arg == LT:
+                            push(left < right)
+                            continue
+                        elif arg == LTE:
+                            push(left <= right)
+                            continue
+                        elif arg == GT:
+                            push(left > right)
+                            continue
+                        elif arg == GTE:
+                            push(left >= right)
+                            continue
+
+                    push(compare(TokenType(arg), left, right))
+                elif op == JUMP_IF_FALSE:
+                    if not pop():
+                        budget -= pc - mark
+                        pc = mark = arg
+                elif op == JUMP:
+                    budget -= pc - mark
+                    pc = mark = arg
+                    if budget <= 0:
+                        budget = yield PAUSED
+                elif op == FOR_ITER:
+                    value = next(stack[-1], None)
+                    if value is None:
+                        pop()
+                        budget -= pc - mark
+                        pc = mark = arg
+                    else:
+                        push(value)
+                elif op == LOAD_GLOBAL:
+                    if arg == 'self':
+                        if self.SELF is None:
+                            VariableUnexistentError(arg)
+                        push(self.SELF)
+                    elif arg in env.symbolTable:
+                        push(env.symbolTable[arg])
+                    else:
+                        push(env.get(arg))
+                elif op == STORE_GLOBAL:
+                    env.symbolTable[arg] = pop()
+                elif op == CALL:
+                    args = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                    func = pop()
+
+                    if type(func) is GlobalNode:
+                        if func.arity != None and func.arity != arg:
+                            FunctionArgumentError(func.arity, arg)
+                        value = func.function(*args)
+                        if type(value) is CoroutineType:
+                            value = yield value
+                        push(value)
+                        continue
+                    elif type(func) is not FunctionNode:
+                        TypeError(getNodeTypeFromValue(func), NodeType.FunctionNode)
+
+                    if len(func.args) != arg:
+                        FunctionArgumentError(len(func.args), arg)
+
+                    budget -= pc - mark
+
+                    # A call right before a return is a tail call, the callee
+                    # takes over this frame instead of stacking one on top, so
+                    # tail recursion runs in constant space
+                    if instructions[pc][0] == RETURN:
+                        if env.borrowed:
+                            env.giveBack()
+                        del stack[base:]
+                        caller = env.caller
+                    else:
+                        frames.append((code, env, pc, base))
+                        base = len(stack)
+                        caller = env
+
+                    code = func.code
+                    env = Environment(self, func.env, size=code.size, names=code.names, caller=caller)
+                    env.slots[:arg] = args
+
+                    instructions = code.instructions
+                    consts = code.consts
+                    slots = env.slots
+                    pc = mark = 0
+
+                    if budget <= 0:
+                        budget = yield PAUSED
+                elif op == RETURN:
+                    value = pop()
+                    if env.borrowed:
+                        env.giveBack()
+                    if len(frames) == 0:
+                        return value
+
+                    budget -= pc - mark
+                    del stack[base:]
+                    code, env, pc, base = frames.pop()
+                    mark = pc
+
+                    instructions = code.instructions
+                    consts = code.consts
+                    slots = env.slots
+                    push(value)
+                elif op == INDEX:
+                    key = pop()
+                    push(env.getitem(pop(), key))
+                elif op == INDEX_PATH:
+                    keys = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                    push(env.walk(pop(), keys))
+                elif op == POP:
+                    pop()
+                elif op == LOAD_DEREF:
+                    depth, slot, name = arg
+                    scope = env
+                    while depth > 0:
+                        scope = scope.parent
+                        depth -= 1
+
+                    value = scope.slots[slot]
+                    if value is EMPTY:
+                        VariableUnexistentError(name)
+                    push(value)
+                elif op == STORE_DEREF:
+                    depth, slot = arg
+                    scope = env
+                    while depth > 0:
+                        scope = scope.parent
+                        depth -= 1
+
+                    scope.slots[slot] = pop()
+                elif op == STORE_INDEX:
+                    value = pop()
+                    key = pop()
+                    env.setitem(pop(), key, value)
+                elif op == NEGATE:
+                    push(unop(pop()))
+                elif op == LENGTH:
+                    push(length(pop()))
+                elif op == FORMAT:
+                    values = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                    push(interpolate(values))
+                elif op == BUILD_ARRAY:
+                    values = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                    push(values)
+                elif op == BUILD_OBJECT:
+                    values = stack[len(stack) - len(arg):]
+                    del stack[len(stack) - len(arg):]
+                    push(dict(zip(arg, values)))
+                elif op == MAKE_FUNCTION:
+                    func = consts[arg]
+                    push(FunctionNode(func.args, [], env, func.size, func))
+                elif op == CLEAR:
+                    for slot in arg:
+                        slots[slot] = EMPTY
+                elif op == ITER_RANGE:
+                    step = pop()
+                    end = pop()
+                    push(counted(pop(), end, step))
+                elif op == ITER_DS:
+                    push(self.iterDS(pop()))
+                elif op == IMPORT:
+                    env.diffimport(self.modules.load(pop()))
+        except EPLError as error:
+            # Errors are raised without a line, the line table of the code
+            # that was running has it
+            if error.line == None:
+                error.line = code.line(pc - 1)
+            raise
+
+class Task:
+    # A script started with VM.start. Every resume runs it for a budget of
+    # instructions and stops at the next jump or call after the budget runs
+    # out, the following resume carries on from exactly there.
+    def __init__(self, vm: VM, code: Code, env: Environment):
+        self.vm = vm
+        self.code = code
+        self.env = env
+        self.steps = None
+        self.done = False
+
+    def resume(self, budget: int):
+        # Returns True once the script has finished
+        if self.done:
+            return True
+
+        try:
+            if self.steps == None:
+                self.steps = self.vm.steps(self.code, self.env, budget)
+                waiting = next(self.steps)
+            else:
+                waiting = self.steps.send(budget)
+        except StopIteration:
+            self.done = True
+            return True
+        except BaseException:
+            self.done = True
+            raise
+
+        if waiting is not PAUSED:
+            waiting.close()
+            self.close()
+            raise Exception(WAITING_BUILTIN)
+
+        return False
+
+    def close(self):
+        # Stops a script that hasn't finished, it can't be resumed after
+        if self.steps != None:
+            self.steps.close()
+        self.done = True
@@ -0,0 +1,783 @@
+from Lexer import Lexer
+from Parser import Parser, Node, NodeType, VarGetNode
+from Interpreter import Interpreter
+from VM import VM
+from Modules import ModuleRegistry
+from Resolver import Resolver
+from Error import EPLError
+import Optimizer
+import Program
+import Batch
+import Cache
+
+from time import perf_counter
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+BENCHMARKS = {}
+
+def benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+def parse(source):
+    return Parser(Lexer(source).lex()).parse()
+
+def run(source):
+    interpreter = Interpreter(parse(source))
+    interpreter.evaluate()
+
+    return interpreter.current_env
+
+@benchmark
+def array_index():
+    # Indexing cost has to stay flat as the array grows, so time a loop of
+    # lookups against the same loop without them
+    for size in [1000, 10000, 100000]:
+        env = run(f'''
+arr = []
+t = time()
+for i in 0, {size - 1} {{
+    arr[i] = i
+}}
+build = time() - t
+
+t = time()
+for i in 0, 9999 {{
+    x = i * {size // 10000}
+}}
+empty = time() - t
+
+t = time()
+for i in 0, 9999 {{
+    x = arr[i * {size // 10000}]
+}}
+index = time() - t - empty
+''')
+
+        build = env.get('build') / size * 1e6
+        index = env.get('index') / 10000 * 1e6
+        print(f'size {size:>6}: build {build:7.2f} us/elem, index {index:7.2f} us/op')
+
+@benchmark
+def array_memory():
+    # Bytes held by the array structure itself, every element is the same null
+    size = 20000
+    ast = parse(f'arr = []\nnothing = null\nfor i in 0, {size - 1} {{\n    arr[i] = nothing\n}}\n')
+
+    tracemalloc.start()
+    interpreter = Interpreter(ast)
+    interpreter.evaluate()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f'size {size:>6}: {used / size:7.2f} bytes/elem')
+
+@benchmark
+def call_overhead():
+    # Calls and blocks must not pay for every symbol that is in scope
+    for count in [0, 100, 500]:
+        symbols = ''.join(f'g{i} = {i}\n' for i in range(count))
+        env = run(symbols + '''
+down = (n) => {
+    if n > 0 {
+        down(n - 1)
+    }
+}
+t = time()
+for i in 0, 99 {
+    down(50)
+}
+elapsed = time() - t
+''')
+
+        elapsed = env.get('elapsed') / 5100 * 1e6
+        print(f'{count:>3} globals: {elapsed:7.2f} us/call')
+
+@benchmark
+def tight_loop():
+    # Variable reads and writes in a hot loop, at the top level and in a function
+    env = run('''
+t = time()
+for i in 0, 1000000 {
+    x = i
+}
+top = time() - t
+
+f = () => {
+    for i in 0, 1000000 {
+        x = i
+    }
+}
+t = time()
+f()
+inner = time() - t
+''')
+
+    for name in ['top', 'inner']:
+        elapsed = env.get(name)
+        print(f'{name:>5}: {elapsed:6.2f} s, {elapsed * 1e6 / 1000001:5.2f} us/iter')
+
+@benchmark
+def counted_loop():
+    # Empty numeric for loops, the cost of counting alone, in both engines
+    scripts = {
+        'top': 'for i in 0, 2000000 {\n}\n',
+        'function': 'f = () => {\n    for i in 0, 2000000 {\n    }\n}\nf()\n',
+        'step': 'for i in 0, 6000000, 3 {\n}\n'
+    }
+
+    for name, source in scripts.items():
+        interpreter = Interpreter(parse(source))
+        start = perf_counter()
+        interpreter.evaluate()
+        walk = perf_counter() - start
+
+        vm = VM()
+        code = vm.compile(parse(source))
+        start = perf_counter()
+        vm.run(code)
+        bytecode = perf_counter() - start
+
+        print(f'{name:>8}: tree-walker {2000001 / walk / 1e6:5.2f}M iter/s, vm {2000001 / bytecode / 1e6:5.2f}M iter/s')
+
+@benchmark
+def engines():
+    # Tree-walker against the bytecode VM, compile time excluded
+    scripts = {
+        'loop': '''
+total = 0
+i = 0
+while i < 200000 {
+    total += i * 2
+    i += 1
+}
+''',
+        'calls': '''
+fib = (n) => {
+    if n < 2 {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+result = fib(18)
+'''
+    }
+
+    for name, source in scripts.items():
+        interpreter = Interpreter(parse(source))
+        start = perf_counter()
+        interpreter.evaluate()
+        walk = perf_counter() - start
+
+        vm = VM()
+        code = vm.compile(parse(source))
+        start = perf_counter()
+        vm.run(code)
+        bytecode = perf_counter() - start
+
+        print(f'{name:>5}: tree-walker {walk:6.2f} s, vm {bytecode:6.2f} s, {walk / bytecode:4.1f}x')
+
+@benchmark
+def startup():
+    # Getting a large library file ready to run, from source and from a fresh .gof cache
+    source = ''.join(f'''
+item{i} = [
+    name = "item {i}"
+    values = [{i}, {i} + 1, {i} * 2]
+]
+get{i} = (x) => {{
+    if x > {i} {{
+        return item{i}.values[0] + x
+    }}
+    return "{{x}} of {i}"
+}}
+''' for i in range(1000))
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'library.epl')
+    file = open(path, 'w')
+    file.write(source)
+    file.close()
+
+    try:
+        for kind in [Cache.Kind.AST, Cache.Kind.CODE]:
+            build = Cache.parse if kind == Cache.Kind.AST else lambda contents: VM().compile(Cache.parse(contents))
+
+            start = perf_counter()
+            Cache.load(path, kind, build)
+            cold = perf_counter() - start
+
+            start = perf_counter()
+            Cache.load(path, kind, build)
+            warm = perf_counter() - start
+
+            print(f'{kind.name.lower():>4}: source {cold * 1000:7.1f} ms, cached {warm * 1000:7.1f} ms, {cold / warm:4.1f}x')
+    finally:
+        shutil.rmtree(directory)
+
+@benchmark
+def lexer():
+    # Lexer throughput on about 1 MB of dense code, and of code that is mostly
+    # comments and long strings
+    code = '''account = [
+    name = "user"
+    balance = 1500.25
+    tags = ["a", "b", "c"]
+]
+deposit = (acc, amount) => {
+    if amount <= 0 {
+        return false
+    }
+    acc.balance = acc.balance + amount
+    log("Deposited {amount} into {acc.name}, now {acc.balance}")
+    return true
+}
+for i in 0, 100 {
+    total = total + i * 2 ^ 3 / (i + 1)
+}
+'''
+    documented = '''// Moves money into an account after checking that the amount is positive,
+// the balance is updated in place and the new balance is logged for auditing
+deposit = (acc, amount) => {
+    message = "The deposit could not be completed because the amount was not positive"
+    return message
+}
+/* Older versions of this library kept a separate ledger for every account and
+   merged them at the end of the day, that is no longer needed /*
+'''
+
+    for name, chunk in [('code', code), ('documented', documented)]:
+        source = chunk * (1000000 // len(chunk))
+
+        start = perf_counter()
+        tokens = Lexer(source).lex()
+        elapsed = perf_counter() - start
+
+        print(f'{name:>10}: {len(source) / 1e6:.2f} MB, {len(tokens):>6} tokens, {elapsed:6.3f} s, {len(source) / elapsed / 1e6:6.2f} MB/s')
+
+@benchmark
+def lexer_stream():
+    # Peak memory of parsing a large generated script, with every token
+    # lexed up front and with tokens streamed from the file
+    source = ''.join(f'value{i} = {i} * 2 + {i}\nlog("value {{value{i}}}")\n' for i in range(10000))
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'generated.epl')
+    file = open(path, 'w')
+    file.write(source)
+    file.close()
+
+    try:
+        for name in ['list', 'stream']:
+            tracemalloc.start()
+            start = perf_counter()
+
+            file = open(path, 'r')
+            if name == 'list':
+                Parser(Lexer(file.read()).lex()).parse()
+            else:
+                Parser(Lexer(file).stream()).parse()
+            file.close()
+
+            elapsed = perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            print(f'{name:>6}: {len(source) / 1e6:.2f} MB source, peak {peak / 1e6:6.1f} MB, {elapsed:5.2f} s')
+    finally:
+        shutil.rmtree(directory)
+
+@benchmark
+def parser():
+    # Parser throughput on large generated scripts, the tokens are lexed up
+    # front so only parsing is timed
+    scripts = {
+        'statements': ''.join(f'''total{i} = {i}
+total{i} += {i} * 2
+items{i}.count -= 1
+log("item {{total{i}}}")
+''' for i in range(5000)),
+        'expressions': ''.join(f'x{i} = (a + {i}) * b ^ 2 / (c - d) > {i} and !e or f(g[{i}], h.k) - #s != -{i}\n' for i in range(5000))
+    }
+
+    for name, source in scripts.items():
+        tokens = Lexer(source).lex()
+
+        start = perf_counter()
+        Parser(tokens).parse()
+        elapsed = perf_counter() - start
+
+        print(f'{name:>11}: {len(tokens):>6} tokens, {elapsed:6.3f} s, {len(tokens) / elapsed / 1e3:6.0f} k tokens/s')
+
+def blocks(snapshot):
+    return sum(stat.count for stat in snapshot.statistics('filename'))
+
+@benchmark
+def node_memory():
+    # Bytes per node of a parsed program, and what each arithmetic result
+    # costs while it is alive
+    source = ''.join(f'v{i} = (a + {i}) * b - f(c[{i}], "s")\n' for i in range(10000))
+    tokens = Lexer(source).lex()
+
+    tracemalloc.start()
+    ast = Parser(tokens).parse()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f'     ast: {used / Optimizer.count(ast):7.1f} bytes/node')
+
+    count = 100000
+    interpreter = Interpreter(parse('x = 1.5\n'))
+    interpreter.evaluate()
+    node = parse('y = x + 1\n')[0].value
+    Resolver(interpreter.globals.keys()).resolve([node])
+    results = [None] * count
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    start = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        results[i] = interpreter.visitExpression(node)
+    used = tracemalloc.get_traced_memory()[0] - start
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    print(f'  binop: {used / count:7.1f} bytes/result, {(blocks(after) - blocks(before)) / count:4.1f} allocations/result')
+
+@benchmark
+def dispatch():
+    # Cost of handing a single node to its visitor, measured on nodes that do
+    # almost nothing once they get there
+    interpreter = Interpreter(parse('x = 1\n'))
+    interpreter.evaluate()
+    count = 200000
+
+    cases = {
+        'literal': (interpreter.visitExpression, Node(NodeType.NumberNode, 1)),
+        'variable': (interpreter.visitExpression, VarGetNode('x')),
+        'assign': (interpreter.visitStatement, interpreter.nodes[0])
+    }
+
+    for name, (visit, node) in cases.items():
+        start = perf_counter()
+        for _ in range(count):
+            visit(node)
+        elapsed = perf_counter() - start
+
+        print(f'{name:>8}: {elapsed / count * 1e9:6.0f} ns/node')
+
+@benchmark
+def interpolation():
+    # Building one string out of many interpolated values
+    for count in [2, 20, 200]:
+        template = ''.join(f'part {{x}} ' for _ in range(count))
+        env = run(f'''
+x = "abcdefghij"
+t = time()
+for i in 0, 999 {{
+    s = "{template}"
+}}
+elapsed = time() - t
+''')
+
+        print(f'{count:>3} parts: {env.get("elapsed") * 1000:7.3f} us/string')
+
+@benchmark
+def builtin_calls():
+    # Calling a builtin in a loop, with the cost of the bare loop taken out
+    source = '''
+t = time()
+for i in 0, 99999 {
+    s = i
+}
+empty = time() - t
+
+t = time()
+for i in 0, 99999 {
+    s = tostring(i)
+}
+elapsed = time() - t - empty
+'''
+
+    walk = run(source).get('elapsed')
+    vm = VM()
+    bytecode = vm.run(vm.compile(parse(source))).get('elapsed')
+
+    print(f'tree-walker {walk / 100000 * 1e6:5.2f} us/call, vm {bytecode / 100000 * 1e6:5.2f} us/call')
+
+@benchmark
+def embedding():
+    # A small rule evaluated over and over with different inputs, parsing it
+    # into a new interpreter every time against running one compiled program
+    source = '''
+limit = 100 * level
+allowed = amount <= limit and blocked == false
+reason = "amount {amount} over {limit}"
+'''
+    count = 10000
+    inputs = [{'amount': float(i % 500), 'level': float(i % 5), 'blocked': i % 7 == 0} for i in range(count)]
+
+    start = perf_counter()
+    for values in inputs:
+        interpreter = Interpreter(parse(source))
+        interpreter.current_env.symbolTable.update(values)
+        interpreter.evaluate()
+    fresh = perf_counter() - start
+
+    program = Program.compile(source, inputs[0].keys())
+    interpreter = Interpreter()
+    start = perf_counter()
+    for values in inputs:
+        interpreter.run(program, values)
+    compiled = perf_counter() - start
+
+    print(f'   fresh: {fresh / count * 1e6:7.1f} us/run')
+    print(f'compiled: {compiled / count * 1e6:7.1f} us/run, {fresh / compiled:4.1f}x')
+
+THREAD_SCRIPTS = {
+    'calls': '''
+fib = (n) => {
+    if n < 2 {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+result = fib(14)
+''',
+    'methods': '''
+counter = [
+    n = 0
+    add = (k) => {
+        self.n = self.n + k
+        return self.n
+    }
+]
+result = 0
+for i in 0, 200 {
+    result = result + counter.add(i)
+}
+''',
+    'breaks': '''
+first = (limit) => {
+    found = 0
+    for i in 0, limit {
+        if i * i > limit {
+            found = i
+            break
+        }
+    }
+    return found
+}
+result = 0
+for n in 0, 300 {
+    result = result + first(n * 10)
+}
+''',
+    'strings': '''
+words = []
+for i in 0, 300 {
+    words[i] = "w{i}"
+}
+result = "{#words} {words[150]} {words[300]}"
+'''
+}
+
+def threadResult(engine, compiled):
+    # One script on an engine of its own, as each worker thread would run it
+    if engine == 'vm':
+        return VM().run(compiled).get('result')
+
+    return Interpreter().run(compiled).get('result')
+
+@benchmark
+def threads():
+    # Many scripts run at once on a thread pool, each on its own engine, must
+    # give the same results as running them one after another
+    from concurrent.futures import ThreadPoolExecutor
+
+    compiled = {}
+    for name, source in THREAD_SCRIPTS.items():
+        compiled[('tree-walker', name)] = Program.compile(source)
+        compiled[('vm', name)] = VM().compile(parse(source))
+
+    # Runs of the same script are next to each other so they overlap
+    jobs = [key for key in compiled for _ in range(25)]
+
+    start = perf_counter()
+    expected = {key: threadResult(key[0], compiled[key]) for key in compiled}
+    serial = [threadResult(engine, compiled[(engine, name)]) for engine, name in jobs]
+    serial = perf_counter() - start
+
+    # Switching threads far more often than usual shakes out shared state
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    start = perf_counter()
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda key: threadResult(key[0], compiled[key]), jobs))
+    finally:
+        sys.setswitchinterval(interval)
+    threaded = perf_counter() - start
+
+    wrong = sum(1 for key, result in zip(jobs, results) if result != expected[key])
+    print(f'{len(jobs)} runs on 8 threads: {wrong} wrong results, serial {serial:5.2f} s, threaded {threaded:5.2f} s')
+
+@benchmark
+def batch():
+    # One rule over a batch of records, a new interpreter per record in this
+    # process against the batch runner's worker pools
+    source = '''
+score = 0
+for i in 0, 50 {
+    score = score + amount * i / 700
+}
+allowed = score > limit
+'''
+    count = 4000
+    records = [{'amount': float(i % 100), 'limit': float(i % 300)} for i in range(count)]
+
+    ast = parse(source)
+    start = perf_counter()
+    for record in records:
+        interpreter = Interpreter(ast)
+        interpreter.current_env.symbolTable.update(record)
+        interpreter.evaluate()
+    elapsed = perf_counter() - start
+    print(f'     loop: {count / elapsed:7.0f} records/s')
+
+    program = Program.compile(source, records[0].keys())
+    for processes in sorted({1, 2, os.cpu_count()}):
+        start = perf_counter()
+        for _ in Batch.run(program, records, ['allowed'], processes):
+            pass
+        elapsed = perf_counter() - start
+        print(f'{processes:>2} procs: {count / elapsed:7.0f} records/s')
+
+@benchmark
+def async_sleep():
+    # Many polling scripts sleeping at the same time on one event loop, run
+    # one after another they would take count times as long
+    import asyncio
+    import threading
+    import Builtins
+
+    source = '''
+polls = 0
+while polls < 4 {
+    sleep(0.05)
+    polls += 1
+}
+'''
+
+    async def main(count):
+        vms = [VM(Builtins.asynchronous()) for _ in range(count)]
+        code = vms[0].compile(parse(source))
+
+        start = perf_counter()
+        envs = await asyncio.gather(*[vm.runAsync(code) for vm in vms])
+        elapsed = perf_counter() - start
+
+        done = sum(1 for env in envs if env.get('polls') == 4)
+        print(f'{count:>5} scripts: {elapsed:5.2f} s for 0.20 s of sleep each, {done} finished, {threading.active_count()} thread')
+
+    for count in [10, 1000, 5000]:
+        asyncio.run(main(count))
+
+@benchmark
+def time_slicing():
+    # Running a script in slices of a few instructions at a time against
+    # running it straight through, then a round robin of scripts next to one
+    # that never ends
+    source = '''
+total = 0
+i = 0
+while i < 100000 {
+    total += i * 2
+    i += 1
+}
+'''
+    vm = VM()
+    code = vm.compile(parse(source))
+
+    start = perf_counter()
+    vm.run(code)
+    straight = perf_counter() - start
+    print(f'   straight: {straight:5.2f} s')
+
+    for budget in [10000, 100]:
+        task = VM().start(code)
+        start = perf_counter()
+        while not task.resume(budget):
+            pass
+        elapsed = perf_counter() - start
+        print(f'{budget:>6} each: {elapsed:5.2f} s, {elapsed / straight:4.2f}x')
+
+    tasks = [VM().start(code) for _ in range(4)]
+    runaway = VM().start(vm.compile(parse('spins = 0\nwhile true {\n    spins += 1\n}\n')))
+    rounds = 0
+    while not all(task.done for task in tasks):
+        for task in tasks + [runaway]:
+            task.resume(1000)
+        rounds += 1
+    runaway.close()
+
+    print(f'round robin: 4 scripts done in {rounds} rounds of 1000, the endless one ran {runaway.env.get("spins"):.0f} iterations')
+
+@benchmark
+def control_flow():
+    # Loops running several statements an iteration, where looking for a
+    # pending return or break around every statement used to show
+    scripts = {
+        'straight': '''
+a = 0
+b = 0
+c = 0
+for i in 0, 100000 {
+    a = i
+    b = a
+    c = b
+    a = c
+    b = a
+}
+''',
+        'nested': '''
+f = () => {
+    hits = 0
+    for i in 0, 100000 {
+        if i > 50000 {
+            if hits > 1000000 {
+                break
+            }
+            hits += 1
+        }
+    }
+    return hits
+}
+hits = f()
+''',
+        'continue': '''
+total = 0
+for i in 0, 100000 {
+    if i < 50000 {
+        continue
+    }
+    total += i
+}
+'''
+    }
+
+    for name, source in scripts.items():
+        try:
+            interpreter = Interpreter(parse(source))
+        except EPLError:
+            print(f'{name:>8}: not supported')
+            continue
+
+        start = perf_counter()
+        interpreter.evaluate()
+        elapsed = perf_counter() - start
+
+        print(f'{name:>8}: {elapsed:5.2f} s, {elapsed / 100001 * 1e6:5.2f} us/iter')
+
+RECURSION = '''
+down = (n) => {
+    if n < 1 {
+        return 0
+    }
+    return 1 + down(n - 1)
+}
+count = (n, total) => {
+    if n < 1 {
+        return total
+    }
+    return count(n - 1, total + 1)
+}
+'''
+
+def execute(engine, source):
+    if engine == 'vm':
+        vm = VM()
+        return vm.run(vm.compile(parse(source)))
+    return run(source)
+
+@benchmark
+def recursion():
+    # How deep plain recursion gets in each engine, then tail recursion far
+    # past that, timed and with the memory it peaks at
+    for engine in ['tree-walker', 'vm']:
+        deepest = 0
+        for depth in [100, 1000, 3000, 10000, 100000]:
+            try:
+                execute(engine, RECURSION + f'result = down({depth})\n')
+            except (RecursionError, EPLError):
+                break
+            deepest = depth
+
+        calls = 100000
+        try:
+            start = perf_counter()
+            execute(engine, RECURSION + f'result = count({calls}, 0)\n')
+            elapsed = perf_counter() - start
+
+            tracemalloc.start()
+            execute(engine, RECURSION + f'result = count({calls}, 0)\n')
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            tail = f'{elapsed / calls * 1e6:5.2f} us/call, {peak / 1024:7.0f} KiB peak'
+        except (RecursionError, EPLError):
+            tracemalloc.stop()
+            tail = 'fails'
+
+        print(f'{engine:>11}: plain recursion {deepest:>6} deep, {calls} tail calls {tail}')
+
+class UncachedRegistry(ModuleRegistry):
+    # Runs a module on every import, like imports did before the registry
+    def load(self, path: str, line: int = None):
+        self.invalidate(path)
+        return super().load(path, line)
+
+@benchmark
+def diamond_import():
+    # A main file importing 20 modules that all import the same base library
+    width = 20
+    directory = tempfile.mkdtemp()
+    files = {
+        'base.epl': ''.join(f'helper{i} = (x) => x * {i}\ntable{i} = [{i}, {i} + 1, {i} + 2]\n' for i in range(200)),
+        'main.epl': ''.join(f'import "{os.path.join(directory, f"mid{i}.epl")}"\n' for i in range(width))
+    }
+    for i in range(width):
+        files[f'mid{i}.epl'] = f'import "{os.path.join(directory, "base.epl")}"\nmid{i} = helper{i}({i})\n'
+
+    for name, source in files.items():
+        file = open(os.path.join(directory, name), 'w')
+        file.write(source)
+        file.close()
+
+    try:
+        ast = Cache.load(os.path.join(directory, 'main.epl'))
+        # Warm the .gof cache so only running the modules is timed
+        Interpreter(ast).evaluate()
+
+        for registry in [UncachedRegistry, ModuleRegistry]:
+            interpreter = Interpreter(Cache.load(os.path.join(directory, 'main.epl')))
+            interpreter.modules = registry(interpreter.runModule)
+
+            start = perf_counter()
+            interpreter.evaluate()
+            elapsed = perf_counter() - start
+
+            print(f'{registry.__name__:>16}: {elapsed * 1000:7.1f} ms')
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS.keys())
+
+    for name in names:
+        print(f'-- {name}')
+        BENCHMARKS[name]()
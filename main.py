@@ -1,5 +1,14 @@
 from Parser import *
 from Interpreter import Interpreter
+from VM import VM
+from hashlib import sha256
+from Optimizer import Optimizer
+import Program
+import Batch
+import Cache
+from itertools import chain
+import json
+import os
 import sys
 
 def dump_ast(obj, indent=0, indent_level=0):
@@ -48,45 +57,110 @@ def display_environment(env, full : bool = False):
     for idx, val in symbol.items():
         if full and idx in env.globals: continue
 
-        if val.type in [NodeType.StringNode, NodeType.BooleanNode, NodeType.NullNode, NodeType.NumberNode]:
-            if val.type == NodeType.StringNode:
-                val = f'"{val.value}"'
+        valType = getNodeTypeFromValue(val)
+        if valType in [NodeType.StringNode, NodeType.BooleanNode, NodeType.NullNode, NodeType.NumberNode]:
+            if valType == NodeType.StringNode:
+                val = f'"{val}"'
             else:
-                val = val.value
-        else:
-            val = val.type.name
+                val = plain(val)
+        elif valType != None:
+            val = valType.name
         
         print(f'{idx} = {val}')
 
 
-sysargs = sys.argv[1:]
-__type__ = sysargs[0]
-filename = sysargs[1]
+def optimized(ast):
+    optimizer = Optimizer()
+    ast = optimizer.optimize(ast)
+    print(f'Optimizer eliminated {optimizer.eliminated} nodes', file=sys.stderr)
+
+    return ast
+
+# Guarded so the worker processes of batch mode can import this file
+if __name__ == '__main__':
+    sysargs = sys.argv[1:]
+    __type__ = sysargs[0]
+    filename = sysargs[1]
+    optimize = '-o' in sysargs
+
+    if filename.split('.')[1] == 'epl':
+        if __type__ == '-i':
+            ## LEXING AND PARSING, SKIPPED WHEN A FRESH CACHE EXISTS
+            ast = Cache.load(filename, Cache.Kind.AST)
+
+            if optimize:
+                ast = optimized(ast)
+
+            ## INTERPRETING
+            interpreter = Interpreter(ast)
+            interpreter.optimize = optimize
+            interpreter.evaluate()
+
+            if sysargs[-1] == '-d' or sysargs[-1] == '-fd':
+                print('\n\n')
+                display_environment(interpreter.current_env, False if sysargs[-1] == '-fd' else True)
+
+        elif __type__ == '-c':
+            ## COMPILING
+            file = open(filename, 'r')
+            contents = file.read()
+            file.close()
+
+            ast = Cache.parse(contents)
+
+            if optimize:
+                ast = optimized(ast)
+
+            code = VM().compile(ast)
 
-if filename.split('.')[1] == 'epl':
-    file = open(filename, 'r')
-    contents = file.read()
+            stat = os.stat(filename)
+            Cache.writeGof(filename.split('.')[0] + '.gof', Cache.Kind.CODE, code, stat.st_mtime_ns, stat.st_size, sha256(contents.encode()).digest())
 
-    ## LEXING
-    lexer = Lexer(contents)
-    tokens = lexer.lex()
+            if sysargs[-1] == '-d':
+                print(code.disassemble())
 
-    ## PARSING
-    parser = Parser(tokens)
-    ast = parser.parse()
+        elif __type__ == '-r':
+            ## COMPILING, SKIPPED WHEN A FRESH CACHE EXISTS, AND RUNNING
+            vm = VM()
+            vm.optimize = optimize
 
-    if __type__ == '-i':
-        ## INTERPRETING
-        interpreter = Interpreter(ast)
-        interpreter.evaluate()
+            if optimize:
+                code = vm.compile(optimized(Cache.load(filename, Cache.Kind.AST)))
+            else:
+                code = vm.load(filename)
+
+            env = vm.run(code)
+
+            if sysargs[-1] == '-d' or sysargs[-1] == '-fd':
+                print('\n\n')
+                display_environment(env, False if sysargs[-1] == '-fd' else True)
+
+        elif __type__ == '-b':
+            ## RUNNING THE FILE ONCE FOR EVERY RECORD OF A JSON LINES FILE
+            file = open(filename, 'r')
+            contents = file.read()
+            file.close()
+
+            records = open(sysargs[2], 'r')
+            lines = (json.loads(line, parse_int=float) for line in records if line.strip())
+
+            # The first record names the inputs every record provides
+            first = next(lines, None)
+            if first != None:
+                program = Program.compile(contents, first.keys(), optimize)
+                for result in Batch.run(program, chain([first], lines)):
+                    print(json.dumps(result))
+
+            records.close()
+    elif filename.split('.')[1] == 'gof' and __type__ == '-r':
+        ## RUNNING
+        code = Cache.loadGof(filename, Cache.Kind.CODE)
+
+        vm = VM()
+        env = vm.run(code)
 
         if sysargs[-1] == '-d' or sysargs[-1] == '-fd':
             print('\n\n')
-            display_environment(interpreter.current_env, False if sysargs[-1] == '-fd' else True)
-
-    elif __type__ == '-c':
-        print('Compilation coming soon.')
-    
-    file.close()
-else:
-    print(f'Invalid File Name {filename}')
+            display_environment(env, False if sysargs[-1] == '-fd' else True)
+    else:
+        print(f'Invalid File Name {filename}')
@@ -0,0 +1,191 @@
+from contextlib import redirect_stdout
+from io import StringIO
+
+import pytest
+
+import Cache
+from Interpreter import Interpreter
+from VM import VM
+from Error import EPLError, ErrorType
+
+# Every program runs on the tree-walker and on the VM, both have to print the
+# expected output and stop with the expected error, as (type, line), if any.
+
+PROGRAMS = {
+    'arithmetic': ('''
+x = (2 + 3) * 4 ^ 2 / 8
+log(x)
+log(-x + 1)
+log("{x} and {#("four")}")
+''', '10.0\n-9.0\n10 and 4\n', None),
+    'loops': ('''
+total = 0
+for i in 0, 10 {
+    if i == 3 {
+        continue
+    }
+    if i == 8 {
+        break
+    }
+    total += i
+}
+log(total)
+for i in 10, 0, -4 {
+    log(i)
+}
+j = 0
+while j < 3 {
+    j += 1
+}
+log(j)
+for entry in [a = 1  b = 2] {
+    log("{entry.key} {entry.value}")
+}
+''', '25.0\n10.0\n6.0\n2.0\n3.0\na 1\nb 2\n', None),
+    'functions': ('''
+make = (start) => {
+    count = start
+    return () => {
+        count += 1
+        return count
+    }
+}
+next = make(10)
+next()
+log(next())
+fib = (n) => {
+    if n < 2 {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+log(fib(12))
+loop = (n, total) => {
+    if n < 1 {
+        return total
+    }
+    return loop(n - 1, total + n)
+}
+log(loop(5000, 0))
+''', '12.0\n144.0\n12502500.0\n', None),
+    'caller variables': ('''
+show = () => log(i)
+for i in 0, 2 {
+    show()
+}
+f = () => log(yy)
+g = () => {
+    yy = 5
+    f()
+}
+g()
+''', '0.0\n1.0\n2.0\n5.0\n', None),
+    'caller variable writes': ('''
+inc = () => {
+    count += 1
+}
+main = () => {
+    count = 0
+    inc()
+    inc()
+    log(count)
+}
+main()
+grow = () => {
+    n = n + 1
+}
+reset = () => {
+    n = 0
+}
+other = () => {
+    n = 5
+    grow()
+    reset()
+    log(n)
+    log(missing)
+}
+other()
+''', '2.0\n6.0\n', (ErrorType.VariableError, 23)),
+    'self': ('''
+a = [
+    v = 1
+    b = [
+        v = 2
+        f = () => self.v
+    ]
+    list = [() => self.v]
+    g = () => self.v
+]
+log(a.b.f())
+log(a.list[0]())
+log(a.g())
+''', '2.0\n1.0\n1.0\n', None),
+    'arrays': ('''
+arr = [1, 2]
+arr[4] = 5
+log(#arr)
+log(arr[3])
+log(arr[9])
+''', '5\n0\n', (ErrorType.IndexError, 6)),
+    'break outside a loop': ('''
+f = () => {
+    log(1)
+    break
+    log(2)
+}
+f()
+''', '', (ErrorType.InvalidSyntaxError, 4)),
+    'continue outside a loop': ('''
+log(1)
+continue
+''', '', (ErrorType.InvalidSyntaxError, 3)),
+    'calling a non-function': ('''
+x = 5
+log(1)
+x()
+''', '1.0\n', (ErrorType.TypeError, 4)),
+    'missing variable': ('''
+log(1)
+log(missing)
+''', '1.0\n', (ErrorType.VariableError, 3)),
+    'wrong argument count': ('''
+f = (a, b) => a + b
+log(f(1, 2))
+log(f(1))
+''', '3.0\n', (ErrorType.FunctionArgumentError, 4)),
+    'division by zero': ('''
+log(1 / 0)
+''', '', (ErrorType.DivisionByZeroError, 2)),
+    'step of zero': ('''
+for i in 0, 10, 0 {
+}
+''', '', (ErrorType.LoopStepError, 2))
+}
+
+def interpret(source):
+    Interpreter(Cache.parse(source)).evaluate()
+
+def compileAndRun(source):
+    vm = VM()
+    vm.run(vm.compile(Cache.parse(source)))
+
+def outcome(engine, source):
+    # What the program printed and the error it stopped with, if any
+    output = StringIO()
+    error = None
+
+    with redirect_stdout(output):
+        try:
+            engine(source)
+        except EPLError as raised:
+            error = (raised.type, raised.line)
+
+    return output.getvalue(), error
+
+@pytest.mark.parametrize('name', PROGRAMS.keys())
+def test_engines(name):
+    source, output, error = PROGRAMS[name]
+    interpreted = outcome(interpret, source)
+
+    assert interpreted == (output, error)
+    assert outcome(compileAndRun, source) == interpreted
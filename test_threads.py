@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+import sys
+
+import Cache
+import Program
+from Interpreter import Interpreter
+from VM import VM
+
+# Scripts running at once on threads, each on an engine of its own, have to
+# give the results they give alone. The threads switch far more often than
+# usual to shake out state the engines share by mistake.
+
+SCRIPTS = {
+    'calls': ('''
+fib = (n) => {
+    if n < 2 {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+result = fib(10)
+''', 55.0),
+    'methods': ('''
+counter = [
+    n = 0
+    add = (k) => {
+        self.n = self.n + k
+        return self.n
+    }
+]
+result = 0
+for i in 0, 50 {
+    result = result + counter.add(i)
+}
+''', 22100.0),
+    'caller variables': ('''
+inc = () => {
+    count += 1
+}
+result = 0
+for i in 0, 50 {
+    count = i
+    inc()
+    result = result + count
+}
+''', 1326.0),
+    'strings': ('''
+words = []
+for i in 0, 100 {
+    words[i] = "w{i}"
+}
+result = "{#words} {words[50]} {words[99]}"
+''', '101 w50 w99')
+}
+
+def run(engine, compiled):
+    if engine == 'vm':
+        return VM().run(compiled).get('result')
+
+    return Interpreter().run(compiled).get('result')
+
+def test_threads():
+    compiled = {}
+    for name, (source, result) in SCRIPTS.items():
+        compiled[('tree-walker', name)] = Program.compile(source)
+        compiled[('vm', name)] = VM().compile(Cache.parse(source))
+
+    # Runs of the same script are next to each other so they overlap
+    jobs = [key for key in compiled for _ in range(8)]
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda key: run(key[0], compiled[key]), jobs))
+    finally:
+        sys.setswitchinterval(interval)
+
+    wrong = [key for key, result in zip(jobs, results) if result != SCRIPTS[key[1]][1]]
+    assert len(wrong) == 0, wrong